@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure import time of the package and the cost of per-record conversions
+
+Import time is measured in fresh interpreters, by timing the import
+statement alone, so interpreter startup is not included. Conversions don't
+need Redis: timestamps are converted from datetime objects, and records are
+decoded from JSON, the same way as they are fetched from the store.
+
+With --check, exits with non-zero status if any of targets is missed. Run
+it from the source checkout as `PYTHONPATH=. benchmarks/bench_startup.py`.
+"""
+import argparse
+import datetime
+import json
+import subprocess
+import sys
+import timeit
+from tagged_logger.records import decode_records, _dt2ts
+
+options = None
+
+
+def parse_args():
+    global options
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-r', '--repeat', type=int, default=10)
+    parser.add_argument('-n', '--records', type=int, default=10000)
+    parser.add_argument('--max-import-ms', type=float, default=50)
+    parser.add_argument('--max-dt2ts-us', type=float, default=1)
+    parser.add_argument('--max-decode-us', type=float, default=5)
+    parser.add_argument('--check', action='store_true',
+                        help='fail if any of targets is missed')
+    options = parser.parse_args()
+
+
+def startup(code):
+    timings = []
+    for i in range(options.repeat):
+        cmd = ('import time; start = time.time(); {0}; '
+               'print(time.time() - start)'.format(code))
+        out = subprocess.check_output([sys.executable, '-c', cmd])
+        timings.append(float(out))
+    return min(timings)
+
+
+def measure_import():
+    code = ('import sys, tagged_logger; '
+            'assert "redis" not in sys.modules, "redis is imported eagerly"')
+    return startup(code) * 1000
+
+
+def measure_dt2ts():
+    dt = datetime.datetime(2012, 1, 1, 12, 30, 15, 123456)
+    timer = timeit.Timer(lambda: _dt2ts(dt))
+    return min(timer.repeat(options.repeat, 100000)) / 100000 * 1e6
+
+
+def measure_decode():
+    records = [json.dumps({
+        'id': i, 'ts': 1325421015.123456 + i, 'expire': None,
+        'message': 'user {user} logged in from {ip}',
+        'attrs': {'user': 'user%d' % i, 'ip': '10.0.0.1'},
+        'tags': ['login', 'user:user%d' % i],
+    }).encode('utf-8') for i in range(options.records)]
+    timer = timeit.Timer(lambda: decode_records(records))
+    return min(timer.repeat(options.repeat, 1)) / options.records * 1e6
+
+
+def main():
+    parse_args()
+    results = [
+        ('import', measure_import(), options.max_import_ms, 'ms'),
+        ('_dt2ts', measure_dt2ts(), options.max_dt2ts_us, 'us per call'),
+        ('decode', measure_decode(), options.max_decode_us, 'us per record'),
+    ]
+    failed = False
+    for name, value, target, unit in results:
+        ok = value <= target
+        failed = failed or not ok
+        print('{0:>6}: {1:.2f} {2} (target {3:g}) {4}'.format(
+            name, value, unit, target, 'ok' if ok else 'MISSED'))
+    if options.check and failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
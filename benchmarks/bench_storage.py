@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare memory footprint of "string" and "hash" record storage layouts
+
+Writes the same records with both layouts and reports Redis memory usage
+per record. Hashes are compact only if buckets fit into listpack/ziplist
+encoding, so pass --tune to raise `hash-max-ziplist-*` limits accordingly.
+Run it against a disposable Redis database, from the source checkout as
+`PYTHONPATH=. benchmarks/bench_storage.py`.
+"""
+import argparse
+import tagged_logger
+
+options = None
+
+
+def parse_args():
+    global options
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--prefix', default='bench_storage')
+    parser.add_argument('-n', '--records', type=int, default=20000)
+    parser.add_argument('-b', '--bucket-size', type=int,
+                        default=tagged_logger.HASH_BUCKET_SIZE)
+    parser.add_argument('--tune', action='store_true',
+                        help='raise hash-max-ziplist-entries and '
+                             'hash-max-ziplist-value limits first')
+    options = parser.parse_args()
+
+
+def used_memory(logger):
+    return logger.redis.info('memory')['used_memory']
+
+
+def measure(storage):
+    logger = tagged_logger.Logger(prefix=options.prefix, storage=storage,
+                                  hash_bucket_size=options.bucket_size)
+    logger.full_cleanup()
+    before = used_memory(logger)
+    for i in range(options.records):
+        logger.log('user {user} logged in from {ip}', user='user%d' % i,
+                   ip='10.0.%d.%d' % (i // 256 % 256, i % 256))
+    # flows are the same for both layouts, leave records only
+    logger.redis.delete(logger._key('flow:__all__'))
+    after = used_memory(logger)
+    logger.full_cleanup()
+    return float(after - before) / options.records
+
+
+def main():
+    parse_args()
+    if options.tune:
+        client = tagged_logger.Logger().redis
+        client.config_set('hash-max-ziplist-entries', options.bucket_size)
+        client.config_set('hash-max-ziplist-value', 1024)
+    for storage in ('string', 'hash'):
+        print('{0:>6}: {1:.1f} bytes per record'.format(storage,
+                                                        measure(storage)))
+
+
+if __name__ == '__main__':
+    main()
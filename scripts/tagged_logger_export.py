@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import tagged_logger as logger
+import argparse
+from dateutil import parser
+
+options = None
+
+def parse_args():
+    global options
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--prefix')
+    parser.add_argument('-t', '--tag', default='__all__')
+    parser.add_argument('--min-ts')
+    parser.add_argument('--max-ts')
+    parser.add_argument('-o', '--output',
+                        help='file to write gzip-compressed NDJSON to '
+                             '(stdout by default)')
+    options = parser.parse_args()
+
+def do_export():
+    logger.configure(prefix=options.prefix)
+    min_ts = options.min_ts and parser.parse(options.min_ts)
+    max_ts = options.max_ts and parser.parse(options.max_ts)
+    if options.output:
+        fileobj = open(options.output, 'wb')
+    else:
+        fileobj = getattr(sys.stdout, 'buffer', sys.stdout)
+    try:
+        count = logger.export(fileobj, tag=options.tag, min_ts=min_ts,
+                              max_ts=max_ts)
+    finally:
+        if options.output:
+            fileobj.close()
+    sys.stderr.write('{0} records exported\n'.format(count))
+
+if __name__ == '__main__':
+    parse_args()
+    do_export()
@@ -11,23 +11,54 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--prefix')
     parser.add_argument('-t', '--tag', default='__all__')
-    parser.add_argument('-l', '--limit')
+    parser.add_argument('-l', '--limit', type=int)
     parser.add_argument('--min-ts')
     parser.add_argument('--max-ts')
     parser.add_argument('-T', '--time-format', default='[%F %T]')
+    parser.add_argument('-f', '--follow', action='store_true',
+                        help='print the latest records and then new ones, '
+                             'as they come')
+    parser.add_argument('--poll', type=float, metavar='SECONDS',
+                        help='with --follow, poll for new records instead of '
+                             'listening for pubsub notifications')
+    parser.add_argument('-g', '--grep', metavar='QUERY',
+                        help='print only records containing all words of the '
+                             'query (requires the text index)')
     options = parser.parse_args()
 
+def print_record(record):
+    ts = record.ts.strftime(options.time_format)
+    formatted = '{0} {1}'.format(ts, str(record))
+    print(formatted)
+
 def do_get():
-    logger.configure(prefix=options.prefix)
+    logger.configure(prefix=options.prefix, text_index=bool(options.grep))
     min_ts = options.min_ts and parser.parse(options.min_ts)
     max_ts = options.max_ts and parser.parse(options.max_ts)
-    records = logger.get(tag=options.tag, limit=options.limit,
-                         min_ts=min_ts, max_ts=max_ts)
+    if options.grep:
+        records = logger.search(options.grep, tag=options.tag,
+                                limit=options.limit, min_ts=min_ts,
+                                max_ts=max_ts)
+    else:
+        records = logger.get(tag=options.tag, limit=options.limit,
+                             min_ts=min_ts, max_ts=max_ts)
     for record in records:
-        ts = record.ts.strftime(options.time_format)
-        formatted = '{0} {1}'.format(ts, str(record))
-        print(formatted)
+        print_record(record)
+
+def do_follow():
+    logger.configure(prefix=options.prefix)
+    for record in logger.follow(tag=options.tag, backlog=options.limit,
+                                poll_interval=options.poll):
+        if options.grep and not record.matches(options.grep):
+            continue
+        print_record(record)
 
 if __name__ == '__main__':
     parse_args()
-    do_get()
+    if options.follow:
+        try:
+            do_follow()
+        except KeyboardInterrupt:
+            print("")
+    else:
+        do_get()
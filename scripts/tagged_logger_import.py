@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import tagged_logger as logger
+import argparse
+
+options = None
+
+def parse_args():
+    global options
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--prefix')
+    parser.add_argument('input', nargs='?',
+                        help='file created by tagged_logger_export.py '
+                             '(stdin by default)')
+    options = parser.parse_args()
+
+def do_import():
+    logger.configure(prefix=options.prefix)
+    if options.input:
+        fileobj = open(options.input, 'rb')
+    else:
+        fileobj = getattr(sys.stdin, 'buffer', sys.stdin)
+    try:
+        count = logger.import_(fileobj)
+    finally:
+        if options.input:
+            fileobj.close()
+    sys.stderr.write('{0} records imported\n'.format(count))
+
+if __name__ == '__main__':
+    parse_args()
+    do_import()
@@ -14,10 +14,12 @@ setup(
     scripts=[
         'scripts/tagged_logger_listen.py',
         'scripts/tagged_logger_get.py',
+        'scripts/tagged_logger_export.py',
+        'scripts/tagged_logger_import.py',
     ],
     install_requires=[
         'redis',
-        'pytz',
+        'pytz; python_version < "3"',
     ],
     classifiers=(
         'Development Status :: 4 - Beta',
@@ -1,19 +1,30 @@
 # -*- coding: utf-8 -*-
-import threading
-import copy
-import calendar
-import json
-import datetime
-import pytz
-import redis
-import time
-
-from contextlib import contextmanager
-from string import Formatter
+"""
+Tagged logger
+
+Only the lightweight part of the package is imported eagerly. The logger
+itself, along with the Redis client library, is imported on the first call
+to :func:`configure`.
+"""
+import sys
+from .constants import (MISSING_KEY, EXPORT_CHUNK_SIZE, HASH_BUCKET_SIZE,
+                        COMPACT_BATCH_SIZE, MAX_RATE_BUCKETS,
+                        REPLICA_PROBE_INTERVAL, REPLICA_TIMEOUT,
+                        SUPPRESSED_TAG, COMPACT_PATTERNS, MAX_TOKENS,
+                        MAX_TOKEN_LENGTH, TOKEN_RE, STOP_WORDS,
+                        IMPORT_BATCH_SIZE, FOLLOW_OVERLAP,
+                        SUPPRESSED_REPORT_INTERVAL, SPOOL_TIMEOUT,
+                        SPOOL_RETRY_INTERVAL)
+from .records import (TaggingAttribute, ta, Log, LogFormatter, tokenize,
+                      get_key, tag_setting, make_cursor, parse_cursor,
+                      get_cache_channel, get_pubsub_channel)
 
 
 _logger = None
-MISSING_KEY = '(undefined)'
+# classes of the "logger" module, imported on demand
+LAZY_ATTRS = frozenset(['Logger', 'ReplicaPool', 'RateLimiter',
+                        'FlowCompactor', 'LogCache', 'DiskSpool'])
+
 
 def check_logger():
     """
@@ -25,21 +36,125 @@ def check_logger():
         raise RuntimeError('Redis logger is not configured')
 
 
-def configure(prefix=None, archive_func=None, **redis_kwargs):
+def configure(prefix=None, archive_func=None, cache_size=None,
+              cache_invalidation=False, indexed_attrs=None, text_index=False,
+              stop_words=STOP_WORDS, max_tokens=MAX_TOKENS, storage='string',
+              hash_bucket_size=HASH_BUCKET_SIZE, flow_caps=None,
+              default_flow_cap=None, expire_mode='sweep',
+              compact_interval=None, sampling=None, rate_limits=None,
+              rate_limit_scope='local',
+              suppressed_report_interval=SUPPRESSED_REPORT_INTERVAL,
+              dedup_window=None, read_replicas=None,
+              replica_selection='round-robin', read_your_writes=None,
+              spool_dir=None, spool_timeout=SPOOL_TIMEOUT,
+              spool_retry_interval=SPOOL_RETRY_INTERVAL, **redis_kwargs):
     """
     Configure logger
 
     :param prefix: prefix to store keys in redis database
     :param archive_func: callable which is about to be invoked on every expire
-                         call
+                         call. See :mod:`tagged_logger.archive` for built-in
+                         archive sinks.
+    :param cache_size: if set, keep at most this amount of decoded log records
+                       in the client-side LRU cache, so that repeated
+                       :func:`get` calls fetch only records they haven't
+                       seen yet
+    :param cache_invalidation: if True, evict cached records removed by other
+                               processes, listening for their notifications
+                               over pubsub
+    :param indexed_attrs: list of attribute names to maintain secondary
+                          indexes for, so that records can be filtered by
+                          these attributes with ``get(where=...)``
+    :param text_index: if True, index words of rendered log messages, so that
+                       records can be found with :func:`search`
+    :param stop_words: set of words which are too common to be indexed
+    :param max_tokens: index at most this amount of distinct words per record
+    :param storage: "string" to store every record in its own key
+                    (`msg:<id>`), or "hash" to pack records into hashes,
+                    bucketed by id (`msgs:<id // hash_bucket_size>`), which
+                    takes less memory. Don't change it for existing data.
+    :param hash_bucket_size: amount of records per hash for "hash" storage
+    :param flow_caps: dict of caps for flows, keyed by tag (or by the key of
+                      the tagging attribute, like "ip" for "ip:<addr>" tags,
+                      or "__all__"). Every cap is the dict with optional
+                      "max_len" (maximum amount of records in the flow) and
+                      "max_age" (in seconds) keys. Flows are trimmed upon
+                      :func:`log`, and records which are not in any flow
+                      anymore get removed.
+    :param default_flow_cap: the cap for flows not mentioned in `flow_caps`
+    :param expire_mode: "sweep" to remove expired records with
+                        :func:`expire`, or "ttl" to let Redis remove them on
+                        its own. TTL mode works only with "string" storage,
+                        and records are not archived.
+    :param compact_interval: if set, run :func:`compact` in the background
+                             thread every `compact_interval` seconds
+    :param sampling: dict of sampling rates (from 0 to 1), keyed the same way
+                     as `flow_caps`. Only this share of records with the
+                     tag is stored.
+    :param rate_limits: dict of (rate, burst) tuples, keyed the same way as
+                        `flow_caps`. Records with the tag are stored at most
+                        `rate` per second on average, with at most `burst`
+                        records at once (token bucket).
+    :param rate_limit_scope: "local" to limit records of this process, or
+                             "cluster" to share limits between processes with
+                             Redis counters. Cluster limits are enforced per
+                             second, and `burst` is not used.
+    :param suppressed_report_interval: store the summary of records dropped
+                                       by sampling and rate limits at most
+                                       once per this amount of seconds
+    :param dedup_window: if set, records with the same message, attributes
+                         and tags, logged within this amount of seconds
+                         after the first one, are not stored. Instead, the
+                         first record gets its occurrence counter and
+                         last-seen timestamp updated.
+    :param read_replicas: optional list of dicts with connection options of
+                          Redis replicas. Reading of flows and records, as
+                          well as pubsub subscriptions, are served by
+                          replicas, while writes, expiration, and queries
+                          by indexes go to the primary.
+    :param replica_selection: either "round-robin" to pick replicas in turn,
+                              or "latency" to pick the one with the lowest
+                              latency
+    :param read_your_writes: if set, reads in the thread which has logged a
+                             record within this amount of seconds go to the
+                             primary, so that they never miss the record
+                             because of the replication lag
+    :param spool_dir: if set, records which can't be written to Redis within
+                      `spool_timeout` seconds are appended to files in this
+                      directory, and written to Redis in the background
+                      once it's available, with their original timestamps
+    :param spool_timeout: latency budget for writes to Redis, in seconds.
+                          Every command times out after it, and the write
+                          gives up before the next round trip once the
+                          budget is spent.
+    :param spool_retry_interval: amount of seconds between attempts to
+                                 write spooled records to Redis
     :param \*\*redis_kwargs: arguments to be passed to Redis constructor
                              (`host`, `port` and `db` make sense)
     """
     global _logger
+    kwargs = dict(prefix=prefix, archive_func=archive_func,
+                  cache_size=cache_size,
+                  cache_invalidation=cache_invalidation,
+                  indexed_attrs=indexed_attrs, text_index=text_index,
+                  stop_words=stop_words, max_tokens=max_tokens,
+                  storage=storage, hash_bucket_size=hash_bucket_size,
+                  flow_caps=flow_caps, default_flow_cap=default_flow_cap,
+                  expire_mode=expire_mode, compact_interval=compact_interval,
+                  sampling=sampling, rate_limits=rate_limits,
+                  rate_limit_scope=rate_limit_scope,
+                  suppressed_report_interval=suppressed_report_interval,
+                  dedup_window=dedup_window, read_replicas=read_replicas,
+                  replica_selection=replica_selection,
+                  read_your_writes=read_your_writes, spool_dir=spool_dir,
+                  spool_timeout=spool_timeout,
+                  spool_retry_interval=spool_retry_interval)
+    kwargs.update(redis_kwargs)
     if _logger:
-        _logger.configure(prefix=prefix, archive_func=archive_func, **redis_kwargs)
+        _logger.configure(**kwargs)
     else:
-        _logger = Logger(prefix=prefix, archive_func=archive_func, **redis_kwargs)
+        from .logger import Logger
+        _logger = Logger(**kwargs)
     return _logger
 
 
@@ -51,7 +166,8 @@ def full_cleanup():
     return _logger.full_cleanup()
 
 
-def get(tag='__all__', limit=None, min_ts=None, max_ts=None, **kwargs):
+def get(tag='__all__', limit=None, min_ts=None, max_ts=None, where=None,
+        **kwargs):
     """
     Get all records from the store
 
@@ -64,6 +180,11 @@ def get(tag='__all__', limit=None, min_ts=None, max_ts=None, **kwargs):
     :type min_ts: :class:`datetime.datetime` with optional tzinfo attached
     :param max_ts: optional maximum timestamp point
     :type max_ts: :class:`datetime.datetime` with optional tzinfo attached
+    :param where: optional dict of filters by indexed attributes (see
+                  `indexed_attrs` in :func:`configure`). Values are matched
+                  exactly, except for (min, max) tuples, which match numeric
+                  values in the range, inclusive. None in the tuple means the
+                  range is open from this side.
     :param \*\*kwargs: the key-value pair used to build a tag. You cannot
                        user more than one key value pair, as it is possible
                        to filter message for at most one tag.
@@ -71,11 +192,14 @@ def get(tag='__all__', limit=None, min_ts=None, max_ts=None, **kwargs):
 
 
     .. note:: Naive datetime objects are considered as having UTC tz and
-              converted to seconds since epoch accordingly
+              converted to seconds since epoch accordingly. Aware ones are
+              converted with their UTC offset (earlier versions ignored
+              the offset)
 
     """
     check_logger()
-    return _logger.get(tag=tag, limit=limit, min_ts=min_ts, max_ts=max_ts, **kwargs)
+    return _logger.get(tag=tag, limit=limit, min_ts=min_ts, max_ts=max_ts,
+                       where=where, **kwargs)
 
 
 def get_latest(tag='__all__', **kwargs):
@@ -88,6 +212,86 @@ def get_latest(tag='__all__', **kwargs):
     return _logger.get_latest(tag=tag, **kwargs)
 
 
+def get_multi(prefixes, tag='__all__', min_ts=None, max_ts=None, limit=None,
+              chunk_size=EXPORT_CHUNK_SIZE, **kwargs):
+    """
+    Get records from the flows of several prefixes, merged in the reverse
+    time order (latest first)
+
+    Flows of all prefixes are queried within one round trip, and records are
+    fetched lazily, `chunk_size` records at a time, as the result is consumed.
+
+    :param prefixes: list of prefixes (see `prefix` in :func:`configure`)
+    :param tag: tag to filter records, the same for every prefix
+    :param limit: return at most this amount of records in total
+    :param min_ts: optional minimum timestamp point
+    :param max_ts: optional maximum timestamp point
+    :param chunk_size: amount of records fetched at once
+    :rtype: iterator of (prefix, :class:`tagged_logger.Log`) tuples
+    """
+    check_logger()
+    return _logger.get_multi(prefixes, tag=tag, min_ts=min_ts, max_ts=max_ts,
+                             limit=limit, chunk_size=chunk_size, **kwargs)
+
+
+def get_since(tag='__all__', cursor=None, limit=None, max_ts=None, **kwargs):
+    """
+    Get records which were added to the flow after the cursor
+
+    Unlike :func:`get`, log records are returned in the time order (oldest
+    first), along with the cursor to pass to the next call. Polling with
+    this function costs only the records which are new since the last call.
+
+    :param tag: the same as in :func:`get`
+    :param cursor: the cursor returned by the previous call, or the
+                   :attr:`Log.cursor` of the latest known record. If None,
+                   records are returned from the very beginning of the flow.
+    :param limit: return at most this amount of records
+    :param max_ts: optional maximum timestamp point
+    :type max_ts: :class:`datetime.datetime` with optional tzinfo attached
+    :param \*\*kwargs: the key-value pair used to build a tag, as in
+                       :func:`get`
+    :rtype: tuple (list of :class:`tagged_logger.Log`, next cursor). If
+            there are no new records, the cursor is returned unchanged.
+
+    .. note:: Records are ordered by their timestamps, which writers take
+              before records reach Redis. A record written by a slow writer
+              (or with explicit `ts`, or replayed from the disk spool) can
+              land behind the cursor, which has already moved past it, and
+              it is never returned by later calls. :func:`follow` polls
+              with an overlap to pick up such records.
+    """
+    check_logger()
+    return _logger.get_since(tag=tag, cursor=cursor, limit=limit,
+                             max_ts=max_ts, **kwargs)
+
+
+def follow(tag='__all__', backlog=None, poll_interval=None,
+           overlap=FOLLOW_OVERLAP, **kwargs):
+    """
+    Yield the latest records of the flow and then new ones, as they come
+
+    Records are yielded without gaps or duplicates on the seam between
+    history and live updates.
+
+    :param tag: the same as in :func:`get`
+    :param backlog: the amount of history records to yield first (all of
+                    them, if None)
+    :param poll_interval: if set, poll the flow with :func:`get_since` every
+                          `poll_interval` seconds instead of listening for
+                          pubsub notifications
+    :param overlap: when polling, re-check records this amount of seconds
+                    older than the latest seen one, so that records, which
+                    reach Redis later than newer ones, are not missed. They
+                    are yielded as soon as they are found, so the time order
+                    is not guaranteed for them.
+    """
+    check_logger()
+    return _logger.follow(tag=tag, backlog=backlog,
+                          poll_interval=poll_interval, overlap=overlap,
+                          **kwargs)
+
+
 def log(message, *tagging_attrs, **attrs):
     """
     Create a new log record, optionally with one or more tags and attributes
@@ -115,7 +319,9 @@ def log(message, *tagging_attrs, **attrs):
     database. These attributes can also be used to format log message
 
     .. note:: Naive datetime objects are considered as having UTC tz and
-              converted to seconds since epoch accordingly
+              converted to seconds since epoch accordingly. Aware ones are
+              converted with their UTC offset (earlier versions ignored
+              the offset)
 
     Examples:
 
@@ -199,337 +405,95 @@ def expire(archive_func=None, ts=None):
     return _logger.expire(archive_func=archive_func, ts=ts)
 
 
-class Logger(object):
-
-    def __init__(self, prefix=None, archive_func=None, **redis_kwargs):
-        self.configure(prefix=prefix, archive_func=archive_func, **redis_kwargs)
-        self._context = threading.local()
-
-    def ensure_context(self):
-        if not hasattr(self._context, 'tags'):
-            self._context.tags = []
-        if not hasattr(self._context, 'attrs'):
-            self._context.attrs = {}
-        if not hasattr(self._context, 'pubsub'):
-            self._context.pubsub = self.redis.pubsub()
-
-    def configure(self, prefix=None, archive_func=None, **redis_kwargs):
-        self.prefix = prefix or ''
-        self.archive_func = archive_func
-        self.redis_kwargs = redis_kwargs
-        self.redis = redis.Redis(**redis_kwargs)
-
-    def full_cleanup(self):
-        templates = ['msg:*', 'flow:*', 'counter']
-        for tmpl in templates:
-            keys = self.redis.keys(self._key(tmpl))
-            if keys:
-                self.redis.delete(*keys)
-
-    def log(self, message, *tagging_attrs, **attrs):
-        self.ensure_context()
-
-        ts = attrs.pop('ts', None)
-        tags = self._extend_tags(tagging_attrs, attrs.pop('tags', None))
-        attrs = self._extend_attrs(tagging_attrs, attrs)
-        expire = self._extend_expire(ts, attrs.pop('expire', None))
-
-        _id = self._id()
-        if ts is not None:
-            timestamp = _dt2ts(ts)
-        else:
-            timestamp = time.time()
-        # save log record
-        log_record_key = self._key('msg:{0}', _id)
-        log_record_value = {
-            'id': _id,
-            'ts': timestamp,
-            'message': message,
-            'attrs': attrs,
-            'tags': tags,
-            'expire': _dt2ts(expire),
-        }
-        str_log_record = json.dumps(log_record_value)
-        self.redis.set(log_record_key, str_log_record)
-        # save log record reference to flows
-        flow_all = self._key('flow:__all__')
-        self.redis.zadd(flow_all, _id, timestamp)
-        for tag in tags:
-            flow_key = self._key('flow:{0}', tag)
-            self.redis.zadd(flow_key, _id, timestamp)
-        # add message to "expire" flow, if required
-        if expire:
-            expire_flow_key = self._key('flow:__expire__')
-            expire_ts = _dt2ts(expire)
-            self.redis.zadd(expire_flow_key, _id, expire_ts)
-        # publish message
-        pubsub_channel = get_pubsub_channel(self.prefix)
-        self.redis.publish(pubsub_channel, str_log_record)
-
-    def _extend_attrs(self, tagging_attrs, attrs):
-        attrs = attrs.copy()
-        for tagging_attr in tagging_attrs:
-            attrs.update(tagging_attr.get_attrs())
-        attrs.update(self._context.attrs)
-        return attrs
-
-    def _extend_tags(self, tagging_attrs, tags):
-        ret = (tags or []) + self._context.tags
-        for tagging_attr in tagging_attrs:
-            ret += tagging_attr.get_tags()
-        return list(set(ret))
-
-    def _extend_expire(self, ts, expire):
-        if expire is None:
-            return None
-        if isinstance(expire, datetime.datetime):
-            return expire
-        if isinstance(expire, datetime.timedelta):
-            return ts + expire
-        return ts + datetime.timedelta(seconds=expire)
-
-    def get(self, tag='__all__', limit=None, min_ts=None, max_ts=None, **kwargs):
-
-        if isinstance(tag, TaggingAttribute):
-            kwargs = tag.get_attrs()
-
-        if len(kwargs.keys()) > 1:
-            raise RuntimeError('Unable to filter for more than one tag. The '
-                               'filter expression is {0}'.format(kwargs))
-        elif len(kwargs.keys()) == 1:
-            key, value = list(kwargs.items())[0]
-            tag = '{0}:{1}'.format(key, value)
-
-        key = self._key('flow:{0}', tag)
-
-        max = _dt2ts(max_ts) if max_ts else float('inf')
-        min = _dt2ts(min_ts) if min_ts else 0
-        start = None if limit is None else 0
-
-        record_ids = self.redis.zrevrangebyscore(key, max, min, start=start,
-                                                 num=limit)
-        if not record_ids:
-            return []
-        record_keys = [self._key('msg:{0}', _id.decode('utf-8')) for _id in record_ids]
-        records = self.redis.mget(record_keys)
-        return [Log(record) for record in records]
-
-    def get_latest(self, tag='__all__', **kwargs):
-        get_result = self.get(tag, limit=1, **kwargs)
-        return get_result and get_result[0]
-
-    def _id(self):
-        cnt = self._key('counter')
-        return self.redis.incr(cnt)
-
-    def _key(self, key, *args, **kwargs):
-        return get_key(self.prefix, key, *args, **kwargs)
-
-    @contextmanager
-    def context(self, *tags, **attrs):
-        self.ensure_context()
-        old_tags = copy.copy(self._context.tags)
-        old_attrs = self._context.attrs.copy()
-        for tag in tags:
-            if isinstance(tag, TaggingAttribute):
-                self._context.tags += tag.get_tags()
-                self._context.attrs.update(tag.get_attrs())
-            else:
-                self._context.tags.append(tag)
-        self._context.attrs.update(attrs)
-        try:
-            yield
-        finally:
-            self._context.tags = old_tags
-            self._context.attrs = old_attrs
-
-    def add_tags(self, *tags):
-        self.ensure_context()
-        for tag in tags:
-            if tag not in self._context.tags:
-                self._context.tags.append(tag)
-
-    def rm_tags(self, *tags):
-        self.ensure_context()
-        for tag in tags:
-            if tag in self._context.tags:
-                self._context.tags.remove(tag)
-
-    def add_attrs(self, **attrs):
-        self.ensure_context()
-        self._context.attrs.update(attrs)
-
-    def rm_attrs(self, *attrs):
-        self.ensure_context()
-        for attr in attrs:
-            self._context.attrs.pop(attr, None)
-
-    def add_tagging_attrs(self, *tagging_attrs, **kwargs):
-        if kwargs:
-            tagging_attrs = list(tagging_attrs) + [TaggingAttribute(**kwargs)]
-        for tagging_attr in tagging_attrs:
-            self.add_tags(*tagging_attr.get_tags())
-            self.add_attrs(**tagging_attr.get_attrs())
-
-    def rm_tagging_attrs(self, *tagging_attrs, **kwargs):
-        if kwargs:
-            tagging_attrs = list(tagging_attrs) + [TaggingAttribute(**kwargs)]
-        for tagging_attr in tagging_attrs:
-            self.rm_tags(*tagging_attr.get_tags())
-            self.rm_attrs(*tagging_attr.get_attrs().keys())
-
-    def reset_context(self):
-        self._context.attrs = {}
-        self._context.tags = []
-
-    def subscribe(self):
-        self.ensure_context()
-        pubsub_channel = self._key('log-records')
-        self._context.pubsub.subscribe(pubsub_channel)
-
-    def unsubscribe(self):
-        self.ensure_context()
-        self._context.pubsub.unsubscribe()
-
-    def listen(self):
-        self.ensure_context()
-        for message in self._context.pubsub.listen():
-            if message['type'] == 'message':
-                data = message['data']
-                yield Log(data)
-
-    def expire(self, archive_func=None, ts=None):
-        ts = _dt2ts(ts) if ts else time.time()
-        flow_expire = self._key('flow:__expire__')
-        flow_all = self._key('flow:__all__')
-
-        record_ids = self.redis.zrevrangebyscore(flow_expire, ts, 0)
-        if not record_ids:
-            return 0
-        record_msgs = [self._key('msg:{0}', _id.decode('utf-8')) for _id in record_ids]
-
-        records = self.redis.mget(*record_msgs)
-        pipe = self.redis.pipeline()
-        for record in records:
-            record_obj = Log(record)
-            if archive_func and callable(archive_func):
-                archive_func(record_obj)
-            elif self.archive_func and callable(self.archive_func):
-                self.archive_func(record_obj)
-            pipe.zrem(flow_all, record_obj.id)
-            for tag in record_obj.tags:
-                flow = self._key('flow:{0}'.format(tag))
-                pipe.zrem(flow, record_obj.id)
-        pipe.zremrangebyscore(flow_expire, 0, ts)
-        pipe.delete(*record_msgs)
-        pipe.execute()
-        return len(records)
-
-
-class TaggingAttribute(object):
-
-    def __init__(self, **attrs):
-        self.attrs = attrs
-
-    def get_tags(self):
-        return ['{0}:{1}'.format(*kv) for kv in self.attrs.items()]
-
-    def get_attrs(self):
-        return self.attrs
-
-
-ta = TaggingAttribute
-
-
-class Log(object):
-
-
-    def __init__(self, record_str):
-        record = json.loads(record_str.decode('utf-8'))
-        self.id = record['id']
-        self.message = record['message']
-        self.attrs = record['attrs']
-        self.tags = record['tags']
-        self.ts = datetime.datetime.fromtimestamp(record['ts'], pytz.utc)
-        if record['expire']:
-            self.expire = datetime.datetime.fromtimestamp(record['expire'],
-                                                          pytz.utc)
-        else:
-            self.expire = None
-        self.record = record
-
-    def __str__(self):
-        formatter = LogFormatter()
-        return str(formatter.vformat(self.message, (), self.attrs))
-
-    def __unicode__(self):
-        formatter = LogFormatter()
-        return unicode(formatter.vformat(self.message, (), self.attrs))
-
-    def __repr__(self):
-        return '<Log@%s: %r attrs=%r tags=%r>' % (self.ts, self.message,
-                                                  self.attrs, self.tags)
-
-
-class LogFormatter(Formatter):
-
-    def get_value(self, key, args, kwargs):
-        try:
-            return Formatter.get_value(self, key, args, kwargs)
-        except KeyError:
-            return MISSING_KEY
-
-    def check_unused_args(self, used_args, args, kwargs):
-        self.unused_args = {}
-        for k, v in kwargs.items():
-            if k not in used_args:
-                self.unused_args[k] = v
-
-    def vformat(self, format_string, args, kwargs):
-        self.unused_args = {}
-        ret = Formatter.vformat(self, format_string, args, kwargs)
-        if not self.unused_args:
-            return ret
-        extra_data =  ', '.join('{0}={1}'.format(*kv) for kv in self.unused_args.items())
-        return '{0} ({1})'.format(ret, extra_data)
-
-def _dt2ts(dt):
+def export(fileobj, tag='__all__', min_ts=None, max_ts=None,
+           chunk_size=EXPORT_CHUNK_SIZE, **kwargs):
+    """
+    Export log records of the flow to gzip-compressed NDJSON file
+
+    Records are streamed in the time order, `chunk_size` records at a time,
+    and written exactly as they are stored in the database, one JSON object
+    per line.
+
+    :param fileobj: binary file-like object to write to
+    :param tag: the same as in :func:`get`
+    :param min_ts: optional minimum timestamp point
+    :param max_ts: optional maximum timestamp point
+    :return: the amount of exported records
+    """
+    check_logger()
+    return _logger.export(fileobj, tag=tag, min_ts=min_ts, max_ts=max_ts,
+                          chunk_size=chunk_size, **kwargs)
+
+
+def import_(fileobj, batch_size=IMPORT_BATCH_SIZE):
     """
-    Convert datetime objects to correct timestamps
+    Import log records from the file created by :func:`export`
 
-    Consider naive datetimes as UTC ones
+    Records are restored with their original ids, timestamps, tags and
+    expiration marks, `batch_size` records per pipeline. Records with the
+    same ids which are already in the store get overwritten.
+
+    :param fileobj: binary file-like object to read from
+    :return: the amount of imported records
     """
-    if dt is None:
-        return dt
-    if not dt.tzinfo:
-        dt = pytz.utc.localize(dt)
-    micro = dt.microsecond / 1e6
-    ts = calendar.timegm(dt.timetuple())
-    return ts + micro
+    check_logger()
+    return _logger.import_(fileobj, batch_size=batch_size)
 
 
-def get_key(prefix, key, *args, **kwargs):
+def search(query, tag='__all__', min_ts=None, max_ts=None, limit=None,
+           where=None, **kwargs):
     """
-    Return formatted variant of the Redis key
+    Get records, which messages contain all words of the query
 
-    :param prefix: redis client prefix
-    :param key: key name
-    :param \*args: arguments to format key
-    :param \*\*kwargs: kwargs to format key
-    :return: string object with formatted key
+    Works only if the logger is configured with ``text_index=True``. Log
+    records are returned in the reverse time order (latest first). Words are
+    matched as a whole and case-insensitively, stop words are ignored.
+
+    :param query: string with words to search for
+    :param tag: the same as in :func:`get`
+    :param min_ts: optional minimum timestamp point
+    :param max_ts: optional maximum timestamp point
+    :param limit: return at most this amount of records
+    :param where: optional filters by indexed attributes, as in :func:`get`
+    :rtype: list of :class:`tagged_logger.Log`
     """
-    if prefix:
-        template = '{0}:{1}'.format(prefix, key)
-    else:
-        template = key
-    if args or kwargs:
-        template = template.format(*args, **kwargs)
-    return template
+    check_logger()
+    return _logger.search(query, tag=tag, min_ts=min_ts, max_ts=max_ts,
+                          limit=limit, where=where, **kwargs)
+
+
+def compact(batch_size=COMPACT_BATCH_SIZE):
+    """
+    Make one step of the incremental cleanup of flows and indexes
+
+    Removes references to records, which are not in the store anymore
+    (expired by TTL, or trimmed from capped flows). Every call checks
+    `batch_size` oldest records of up to `batch_size` flows or indexes, so
+    call it periodically, or configure the logger with `compact_interval`.
+
+    :return: the amount of removed references
+    """
+    check_logger()
+    return _logger.compact(batch_size=batch_size)
+
 
-def get_pubsub_channel(prefix):
+def cache_stats():
     """
-    Return key for pubsub channel, used by tagged-logger
-    :param prefix: redis client prefix
-    :return: string with pubsub channel name
+    Return the dict with hit and miss counters of the record cache, or None if
+    the cache is disabled
     """
-    return get_key(prefix, 'log-records')
+    check_logger()
+    return _logger.cache_stats()
+
+
+def __getattr__(name):
+    if name in LAZY_ATTRS:
+        from . import logger
+        return getattr(logger, name)
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(
+        __name__, name))
+
+
+if sys.version_info < (3, 7):  # no module-level __getattr__
+    from .logger import (Logger, ReplicaPool, RateLimiter, FlowCompactor,
+                         LogCache, DiskSpool)
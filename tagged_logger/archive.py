@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Built-in archive sinks for expired log records
+
+Every sink is a callable, so it can be passed as the `archive_func` to
+:func:`tagged_logger.configure` or :func:`tagged_logger.expire`. Besides,
+sinks have the `archive_batch` method, and :func:`tagged_logger.expire`
+hands them all expired records at once, so that they are written with one
+write call or one database transaction per batch.
+
+Custom sinks can follow the same protocol.
+"""
+import os
+import gzip
+import json
+import time
+import sqlite3
+import threading
+
+
+class NDJSONArchive(object):
+    """
+    Archive sink writing records to gzip-compressed NDJSON files
+
+    Records are written one JSON object per line, in the same format as they
+    are stored in Redis. Files are named
+    `<basename>-<YYYYmmddTHHMMSS>[-<seq>].ndjson.gz` and rotated when they
+    grow bigger than `max_bytes` (compressed) or older than `max_age` seconds.
+
+    :param directory: directory to store archive files in
+    :param basename: prefix for archive file names
+    :param max_bytes: optional maximum size of the archive file
+    :param max_age: optional maximum age of the archive file, in seconds
+    :param compresslevel: gzip compression level
+    """
+
+    def __init__(self, directory, basename='archive', max_bytes=None,
+                 max_age=None, compresslevel=6):
+        self.directory = directory
+        self.basename = basename
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compresslevel = compresslevel
+        self.path = None
+        self._raw = None
+        self._file = None
+        self._opened = None
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        self.archive_batch([record])
+
+    def archive_batch(self, records):
+        if not records:
+            return
+        data = b''.join(json.dumps(record.record).encode('utf-8') + b'\n'
+                        for record in records)
+        with self._lock:
+            self._rotate()
+            self._file.write(data)
+            self._file.flush()
+
+    def _rotate(self):
+        if self._file is not None:
+            too_big = self.max_bytes and self._raw.tell() >= self.max_bytes
+            too_old = (self.max_age and
+                       time.time() - self._opened >= self.max_age)
+            if too_big or too_old:
+                self._close()
+        if self._file is None:
+            self._open()
+
+    def _open(self):
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        path = os.path.join(self.directory, '{0}-{1}.ndjson.gz'.format(
+            self.basename, stamp))
+        seq = 0
+        while os.path.exists(path):
+            seq += 1
+            path = os.path.join(self.directory, '{0}-{1}-{2}.ndjson.gz'.format(
+                self.basename, stamp, seq))
+        self._raw = open(path, 'wb')
+        self._file = gzip.GzipFile(fileobj=self._raw, mode='wb',
+                                   compresslevel=self.compresslevel)
+        self._opened = time.time()
+        self.path = path
+
+    def _close(self):
+        self._file.close()
+        self._raw.close()
+        self._file = None
+        self._raw = None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._close()
+
+
+class SQLiteArchive(object):
+    """
+    Archive sink writing records to SQLite database
+
+    Records are stored in the `table` with indexed `ts` column, and their
+    tags are stored in the `<table>_tags` table, indexed by tag and
+    timestamp. Every batch is written in a single transaction.
+
+    For example, to find archived records tagged with "foo"::
+
+        SELECT r.* FROM archive r JOIN archive_tags t ON t.record_id = r.id
+        WHERE t.tag = 'foo' ORDER BY t.ts DESC
+
+    :param path: path to the database file
+    :param table: table name
+    """
+
+    def __init__(self, path, table='archive'):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS {0} ('
+                'id INTEGER PRIMARY KEY, ts REAL NOT NULL, expire REAL, '
+                'message TEXT, attrs TEXT, tags TEXT)'.format(table))
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS {0}_ts ON {0} (ts)'.format(table))
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS {0}_tags ('
+                'record_id INTEGER NOT NULL, tag TEXT NOT NULL, '
+                'ts REAL NOT NULL, '
+                'PRIMARY KEY (record_id, tag))'.format(table))
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS {0}_tags_tag_ts '
+                'ON {0}_tags (tag, ts)'.format(table))
+
+    def __call__(self, record):
+        self.archive_batch([record])
+
+    def archive_batch(self, records):
+        if not records:
+            return
+        rows = []
+        tag_rows = []
+        for record in records:
+            raw = record.record
+            rows.append((raw['id'], raw['ts'], raw['expire'], raw['message'],
+                         json.dumps(raw['attrs']), json.dumps(raw['tags'])))
+            tag_rows += [(raw['id'], tag, raw['ts']) for tag in raw['tags']]
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO {0} '
+                    '(id, ts, expire, message, attrs, tags) '
+                    'VALUES (?, ?, ?, ?, ?, ?)'.format(self.table), rows)
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO {0}_tags (record_id, tag, ts) '
+                    'VALUES (?, ?, ?)'.format(self.table), tag_rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
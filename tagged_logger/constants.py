@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Default settings and limits, shared by the package modules
+"""
+import re
+
+MISSING_KEY = '(undefined)'
+EXPORT_CHUNK_SIZE = 1000
+HASH_BUCKET_SIZE = 1024
+COMPACT_BATCH_SIZE = 100
+MAX_RATE_BUCKETS = 10000
+REPLICA_PROBE_INTERVAL = 5
+REPLICA_TIMEOUT = 1
+SUPPRESSED_TAG = '__suppressed__'
+COMPACT_PATTERNS = ['flow:*', 'idx:*', 'idxnum:*', 'tok:*']
+MAX_TOKENS = 32
+MAX_TOKEN_LENGTH = 64
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has',
+    'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'to', 'was', 'were',
+    'will', 'with',
+])
+IMPORT_BATCH_SIZE = 5000
+FOLLOW_OVERLAP = 5
+SUPPRESSED_REPORT_INTERVAL = 60
+SPOOL_TIMEOUT = 0.1
+SPOOL_RETRY_INTERVAL = 1
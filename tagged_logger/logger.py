@@ -0,0 +1,1567 @@
+# -*- coding: utf-8 -*-
+"""
+Logger storing records in Redis, along with its helpers
+"""
+import threading
+import uuid
+import copy
+import datetime
+import gzip
+import hashlib
+import heapq
+import json
+import random
+import time
+import redis
+
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+from collections import OrderedDict
+from contextlib import contextmanager
+from .constants import (EXPORT_CHUNK_SIZE, HASH_BUCKET_SIZE,
+                        COMPACT_BATCH_SIZE, MAX_RATE_BUCKETS,
+                        REPLICA_PROBE_INTERVAL, REPLICA_TIMEOUT,
+                        SUPPRESSED_TAG, COMPACT_PATTERNS, MAX_TOKENS, STOP_WORDS,
+                        IMPORT_BATCH_SIZE, FOLLOW_OVERLAP,
+                        SUPPRESSED_REPORT_INTERVAL, SPOOL_TIMEOUT,
+                        SPOOL_RETRY_INTERVAL)
+from .records import (Log, TaggingAttribute, decode_records, _render,
+                      tokenize, _dt2ts, UTC, get_key, tag_setting, make_cursor,
+                      parse_cursor, get_cache_channel, get_pubsub_channel)
+from .spool import DiskSpool
+
+
+# set the counter to ARGV[1], unless it's already greater
+BUMP_COUNTER_SCRIPT = """
+local current = tonumber(redis.call('get', KEYS[1]) or '0')
+if current < tonumber(ARGV[1]) then
+    redis.call('set', KEYS[1], ARGV[1])
+end
+"""
+
+# trim capped flows and remove records, which are not in any flow anymore
+# KEYS: flows to trim
+# ARGV: prefix of string record keys, prefix of hash record keys, storage,
+#       hash bucket size, prefix of flow keys, then pairs of maximum length
+#       and minimum score for every flow (empty string for no limit)
+TRIM_SCRIPT = """
+local trimmed = {}
+for i, key in ipairs(KEYS) do
+    local max_len = ARGV[4 + i * 2]
+    local min_score = ARGV[5 + i * 2]
+    if max_len ~= '' then
+        local extra = redis.call('zcard', key) - tonumber(max_len)
+        if extra > 0 then
+            for _, id in ipairs(redis.call('zrange', key, 0, extra - 1)) do
+                trimmed[#trimmed + 1] = id
+            end
+            redis.call('zremrangebyrank', key, 0, extra - 1)
+        end
+    end
+    if min_score ~= '' then
+        local ids = redis.call('zrangebyscore', key, '-inf', '(' .. min_score)
+        for _, id in ipairs(ids) do
+            trimmed[#trimmed + 1] = id
+        end
+        if #ids > 0 then
+            redis.call('zremrangebyscore', key, '-inf', '(' .. min_score)
+        end
+    end
+end
+for _, id in ipairs(trimmed) do
+    local record, bucket
+    if ARGV[3] == 'hash' then
+        bucket = ARGV[2] .. math.floor(tonumber(id) / tonumber(ARGV[4]))
+        record = redis.call('hget', bucket, id)
+    else
+        record = redis.call('get', ARGV[1] .. id)
+    end
+    if record then
+        local alive = redis.call('zscore', ARGV[5] .. '__all__', id)
+        for _, tag in ipairs(cjson.decode(record)['tags']) do
+            alive = alive or redis.call('zscore', ARGV[5] .. tag, id)
+        end
+        if not alive then
+            if bucket then
+                redis.call('hdel', bucket, id)
+            else
+                redis.call('del', ARGV[1] .. id)
+            end
+            redis.call('zrem', ARGV[5] .. '__expire__', id)
+        end
+    end
+end
+return #trimmed
+"""
+
+# increment the occurrence counter of the record, if it's logged within
+# the deduplication window. Counters are the last fields of the record.
+# KEYS: deduplication key
+# ARGV: prefix of string record keys, prefix of hash record keys, storage,
+#       hash bucket size, timestamp of the occurrence
+# Returns the id of the updated record or nil
+DEDUP_SCRIPT = """
+local id = redis.call('get', KEYS[1])
+if not id then
+    return false
+end
+local record, bucket
+if ARGV[3] == 'hash' then
+    bucket = ARGV[2] .. math.floor(tonumber(id) / tonumber(ARGV[4]))
+    record = redis.call('hget', bucket, id)
+else
+    record = redis.call('get', ARGV[1] .. id)
+end
+if not record then
+    return false
+end
+local head, count = string.match(
+    record, '^(.*"count": )(%d+), "last_ts": [^,}]+}$')
+if not head then
+    return false
+end
+record = head .. (tonumber(count) + 1) .. ', "last_ts": ' .. ARGV[5] .. '}'
+if bucket then
+    redis.call('hset', bucket, id, record)
+else
+    local ttl = redis.call('pttl', ARGV[1] .. id)
+    redis.call('set', ARGV[1] .. id, record)
+    if ttl > 0 then
+        redis.call('pexpire', ARGV[1] .. id, ttl)
+    end
+end
+return id
+"""
+
+# count the record in per-second counters of its tags, unless any of
+# counters has reached its limit
+# KEYS: counters of the current second
+# ARGV: limits of counters
+# Returns the index of the counter, which has dropped the record, or 0
+RATE_LIMIT_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    local count = tonumber(redis.call('get', key) or '0')
+    if count + 1 > tonumber(ARGV[i]) then
+        return i
+    end
+end
+for _, key in ipairs(KEYS) do
+    redis.call('incr', key)
+    redis.call('expire', key, 2)
+end
+return 0
+"""
+
+# intersect the flow with secondary indexes and return matching record ids
+# KEYS: flow, temporary key, indexes by value, then pairs of numeric indexes
+#       and temporary keys to store their ranges in
+# ARGV: max ts, min ts, limit (empty string for no limit), number of indexes
+#       by value, then pairs of min and max values for numeric indexes
+QUERY_SCRIPT = """
+local neq = tonumber(ARGV[4])
+local args = {KEYS[2], 0, KEYS[1]}
+local weights = {'weights', 1}
+local tmp_keys = {KEYS[2]}
+for i = 3, 2 + neq do
+    args[#args + 1] = KEYS[i]
+    weights[#weights + 1] = 0
+end
+local n = 5
+for i = 3 + neq, #KEYS, 2 do
+    local range_key = KEYS[i + 1]
+    local ids = redis.call('zrangebyscore', KEYS[i], ARGV[n], ARGV[n + 1])
+    redis.call('del', range_key)
+    for j = 1, #ids, 1000 do
+        local zadd_args = {}
+        for k = j, math.min(j + 999, #ids) do
+            zadd_args[#zadd_args + 1] = 0
+            zadd_args[#zadd_args + 1] = ids[k]
+        end
+        redis.call('zadd', range_key, unpack(zadd_args))
+    end
+    args[#args + 1] = range_key
+    weights[#weights + 1] = 0
+    tmp_keys[#tmp_keys + 1] = range_key
+    n = n + 2
+end
+args[2] = #args - 2
+for i = 1, #weights do
+    args[#args + 1] = weights[i]
+end
+redis.call('zinterstore', unpack(args))
+local ret
+if ARGV[3] == '' then
+    ret = redis.call('zrevrangebyscore', KEYS[2], ARGV[1], ARGV[2])
+else
+    ret = redis.call('zrevrangebyscore', KEYS[2], ARGV[1], ARGV[2],
+                     'limit', 0, ARGV[3])
+end
+redis.call('del', unpack(tmp_keys))
+return ret
+"""
+
+
+class Logger(object):
+
+    def __init__(self, prefix=None, archive_func=None, **kwargs):
+        self.cache = None
+        self.compactor = None
+        self.spool = None
+        self.replicas = None
+        self.configure(prefix=prefix, archive_func=archive_func, **kwargs)
+        self._context = threading.local()
+
+    def ensure_context(self):
+        if not hasattr(self._context, 'tags'):
+            self._context.tags = []
+        if not hasattr(self._context, 'attrs'):
+            self._context.attrs = {}
+        if not hasattr(self._context, 'pubsub'):
+            self._context.pubsub = self._reader().pubsub()
+
+    def configure(self, prefix=None, archive_func=None, cache_size=None,
+                  cache_invalidation=False, indexed_attrs=None,
+                  text_index=False, stop_words=STOP_WORDS,
+                  max_tokens=MAX_TOKENS, storage='string',
+                  hash_bucket_size=HASH_BUCKET_SIZE, flow_caps=None,
+                  default_flow_cap=None, expire_mode='sweep',
+                  compact_interval=None, sampling=None, rate_limits=None,
+                  rate_limit_scope='local',
+                  suppressed_report_interval=SUPPRESSED_REPORT_INTERVAL,
+                  dedup_window=None, read_replicas=None,
+                  replica_selection='round-robin', read_your_writes=None,
+                  spool_dir=None, spool_timeout=SPOOL_TIMEOUT,
+                  spool_retry_interval=SPOOL_RETRY_INTERVAL, **redis_kwargs):
+        if storage not in ('string', 'hash'):
+            raise RuntimeError('Unknown storage {0!r}'.format(storage))
+        if expire_mode not in ('sweep', 'ttl'):
+            raise RuntimeError('Unknown expire mode {0!r}'.format(expire_mode))
+        if expire_mode == 'ttl' and storage != 'string':
+            raise RuntimeError('TTL expire mode requires "string" storage')
+        if rate_limit_scope not in ('local', 'cluster'):
+            raise RuntimeError('Unknown rate limit scope {0!r}'.format(
+                rate_limit_scope))
+        if replica_selection not in ('round-robin', 'latency'):
+            raise RuntimeError('Unknown replica selection {0!r}'.format(
+                replica_selection))
+        self.prefix = prefix or ''
+        self.archive_func = archive_func
+        self.redis_kwargs = redis_kwargs
+        self.redis = redis.Redis(**redis_kwargs)
+        self._bump_counter = self.redis.register_script(BUMP_COUNTER_SCRIPT)
+        self._query = self.redis.register_script(QUERY_SCRIPT)
+        self.indexed_attrs = frozenset(indexed_attrs or ())
+        self.text_index = text_index
+        self.stop_words = frozenset(stop_words or ())
+        self.max_tokens = max_tokens
+        self.storage = storage
+        self.hash_bucket_size = hash_bucket_size
+        self.flow_caps = flow_caps or {}
+        self.default_flow_cap = default_flow_cap
+        self._trim = self.redis.register_script(TRIM_SCRIPT)
+        self.expire_mode = expire_mode
+        self.dedup_window = dedup_window
+        self._dedup = self.redis.register_script(DEDUP_SCRIPT)
+        if self.replicas is not None:
+            self.replicas.stop()
+        if read_replicas:
+            # a replica, which doesn't respond, must not stall readers
+            defaults = dict(socket_timeout=REPLICA_TIMEOUT,
+                            socket_connect_timeout=REPLICA_TIMEOUT)
+            clients = [redis.Redis(**dict(defaults, **kwargs))
+                       for kwargs in read_replicas]
+            self.replicas = ReplicaPool(clients, replica_selection)
+        else:
+            self.replicas = None
+        self.read_your_writes = read_your_writes
+        if self.spool is not None:
+            self.spool.stop()
+        if spool_dir:
+            write_kwargs = dict(redis_kwargs, socket_timeout=spool_timeout,
+                                socket_connect_timeout=spool_timeout)
+            self.spool = DiskSpool(self, spool_dir, redis.Redis(**write_kwargs),
+                                   spool_retry_interval, spool_timeout)
+        else:
+            self.spool = None
+        self._rate_limit = self.redis.register_script(RATE_LIMIT_SCRIPT)
+        if sampling or rate_limits:
+            self.limiter = RateLimiter(self, sampling or {}, rate_limits or {},
+                                       rate_limit_scope,
+                                       suppressed_report_interval)
+        else:
+            self.limiter = None
+        if self.compactor is not None:
+            self.compactor.stop()
+        self.compactor = FlowCompactor(self, compact_interval)
+        if self.cache is not None:
+            self.cache.close()
+        self.cache = LogCache(cache_size) if cache_size else None
+        self.cache_invalidation = cache_invalidation
+        if self.cache is not None and cache_invalidation:
+            self.cache.listen(self.redis.pubsub(),
+                              get_cache_channel(self.prefix), self._key)
+
+    def full_cleanup(self):
+        templates = ['msg:*', 'msgs:*', 'flow:*', 'idx:*', 'idxnum:*', 'tok:*',
+                     'tmp:*', 'ratelimit:*', 'dedup:*', 'counter']
+        for tmpl in templates:
+            keys = self.redis.keys(self._key(tmpl))
+            if keys:
+                self.redis.delete(*keys)
+        # record ids are reused once the counter is removed
+        self._invalidate(None)
+
+    def log(self, message, *tagging_attrs, **attrs):
+        self.ensure_context()
+
+        ts = attrs.pop('ts', None)
+        tags = self._extend_tags(tagging_attrs, attrs.pop('tags', None))
+        attrs = self._extend_attrs(tagging_attrs, attrs)
+        expire = self._extend_expire(ts, attrs.pop('expire', None))
+
+        if self.spool is not None:
+            self.spool.start()
+        if self.limiter is not None:
+            suppressed = self.limiter.pop_suppressed()
+            if suppressed:
+                self._write('Suppressed {suppressed} log records',
+                            {'suppressed': sum(suppressed.values()),
+                             'suppressed_by_tag': suppressed},
+                            [SUPPRESSED_TAG] + [tag for tag in suppressed
+                                                if tag != '__all__'],
+                            None, None)
+            if not self.limiter.allow(['__all__'] + tags):
+                return
+        self._write(message, attrs, tags, ts, expire)
+        self._context.last_write = time.time()
+
+    def _write(self, message, attrs, tags, ts, expire):
+        if ts is not None:
+            timestamp = _dt2ts(ts)
+        else:
+            timestamp = time.time()
+        record = {
+            'ts': timestamp,
+            'message': message,
+            'attrs': attrs,
+            'tags': tags,
+            'expire': _dt2ts(expire),
+        }
+        if self.spool is not None:
+            self.spool.write(record)
+        else:
+            self._put(record)
+
+    def _put(self, record, client=None):
+        """
+        Store the new log record (dict without id) and publish it
+
+        :param client: Redis client to write with, the primary by default
+        """
+        client = client or self.redis
+        timestamp = record['ts']
+        tags = record['tags']
+        dedup_key = None
+        if self.dedup_window:
+            self._check_budget(client)
+            fingerprint = json.dumps([record['message'], record['attrs'],
+                                      sorted(tags)], sort_keys=True)
+            dedup_key = self._key('dedup:{0}', hashlib.sha1(
+                fingerprint.encode('utf-8')).hexdigest())
+            _id = self._dedup(keys=[dedup_key],
+                              args=[self._key('msg:'), self._key('msgs:'),
+                                    self.storage, self.hash_bucket_size,
+                                    repr(timestamp)], client=client)
+            if _id:
+                self._invalidate([_id.decode('utf-8')], client)
+                return
+        self._check_budget(client)
+        _id = self._id(client)
+        log_record_value = {
+            'id': _id,
+            'ts': timestamp,
+            'message': record['message'],
+            'attrs': record['attrs'],
+            'tags': tags,
+            'expire': record['expire'],
+        }
+        str_log_record = json.dumps(log_record_value)
+        pipe = client.pipeline(transaction=False)
+        if dedup_key is not None:
+            # occurrence counters go last, so that they can be updated
+            # without decoding the record
+            str_log_record = '{0}, "count": 1, "last_ts": {1!r}}}'.format(
+                str_log_record[:-1], timestamp)
+            # if another writer has started the window meanwhile, keep it
+            pipe.set(dedup_key, _id, px=int(self.dedup_window * 1000),
+                     nx=True)
+        self._save(pipe, log_record_value, str_log_record)
+        trims = self._trim_flows(pipe, ['__all__'] + tags)
+        # publish message
+        pubsub_channel = get_pubsub_channel(self.prefix)
+        pipe.publish(pubsub_channel, str_log_record)
+        self._check_budget(client)
+        self._execute(pipe, trims, client)
+
+    def _put_many(self, records):
+        """
+        Store new log records (dicts without ids) within one pipeline, and
+        publish them
+        """
+        last_id = self.redis.incrby(self._key('counter'), len(records))
+        pipe = self.redis.pipeline(transaction=False)
+        pubsub_channel = get_pubsub_channel(self.prefix)
+        trims = []
+        for _id, record in enumerate(records, last_id - len(records) + 1):
+            record = dict(record, id=_id)
+            str_record = json.dumps(record)
+            self._save(pipe, record, str_record)
+            trims += self._trim_flows(pipe, ['__all__'] + record['tags'])
+            pipe.publish(pubsub_channel, str_record)
+        self._execute(pipe, trims, self.redis)
+
+    def _execute(self, pipe, trims, client):
+        """
+        Execute the write pipeline, and trim flows once again if Redis
+        doesn't have the trimming script loaded yet
+
+        :param trims: list of (keys, args) of trimming commands in the
+                      pipeline
+        """
+        try:
+            pipe.execute()
+        except redis.exceptions.NoScriptError:
+            # the rest of the pipeline is executed anyway, the script call
+            # loads the script for the next writes
+            if self._over_budget(client):
+                # flows get trimmed on the next write
+                return
+            for keys, args in trims:
+                self._trim(keys=keys, args=args, client=client)
+
+    def _save(self, pipe, record, str_record):
+        """
+        Add commands saving the log record and its references to the pipeline
+
+        :param record: dict with log record, as it is stored in the database
+        :param str_record: JSON-encoded record
+        """
+        _id = record['id']
+        timestamp = record['ts']
+        # save log record
+        self._store(pipe, _id, str_record)
+        # save log record reference to flows
+        pipe.zadd(self._key('flow:__all__'), _id, timestamp)
+        for tag in record['tags']:
+            pipe.zadd(self._key('flow:{0}', tag), _id, timestamp)
+        # add message to "expire" flow, if required
+        if record['expire'] and self.expire_mode == 'ttl':
+            pipe.pexpireat(self._key('msg:{0}', _id),
+                           int(record['expire'] * 1000))
+        elif record['expire']:
+            pipe.zadd(self._key('flow:__expire__'), _id, record['expire'])
+        # update secondary indexes
+        for key, score in self._index_keys(record):
+            pipe.zadd(key, _id, score)
+
+    def _flow_cap(self, tag):
+        return tag_setting(self.flow_caps, tag, self.default_flow_cap)
+
+    def _trim_flows(self, pipe, tags):
+        """
+        Add the command trimming capped flows to the pipeline
+
+        The script is called by its SHA, as redis-py checks scripts
+        registered in the pipeline with SCRIPT EXISTS on every execution,
+        which takes one more round trip per write.
+
+        :return: list of (keys, args) of added commands
+        """
+        keys = []
+        args = [self._key('msg:'), self._key('msgs:'), self.storage,
+                self.hash_bucket_size, self._key('flow:')]
+        now = time.time()
+        for tag in tags:
+            cap = self._flow_cap(tag)
+            if not cap:
+                continue
+            max_len = cap.get('max_len')
+            max_age = cap.get('max_age')
+            keys.append(self._key('flow:{0}', tag))
+            args += ['' if max_len is None else max_len,
+                     '' if max_age is None else now - max_age]
+        if not keys:
+            return []
+        pipe.evalsha(self._trim.sha, len(keys), *(keys + args))
+        return [(keys, args)]
+
+    def _over_budget(self, client):
+        """
+        Return True if the write with the spool client has spent the latency
+        budget of the spool
+        """
+        spool = self.spool
+        return (spool is not None and client is spool.client and
+                spool.expired())
+
+    def _check_budget(self, client):
+        """
+        Give up the write with the spool client before the next round trip
+        to Redis, once the latency budget of the spool is spent, so that the
+        record goes to the spool
+        """
+        if self._over_budget(client):
+            raise redis.TimeoutError('Spool timeout of {0} seconds '
+                                     'exceeded'.format(self.spool.timeout))
+
+    def _store(self, pipe, _id, str_record):
+        if self.storage == 'hash':
+            pipe.hset(self._bucket_key(_id), _id, str_record)
+        else:
+            pipe.set(self._key('msg:{0}', _id), str_record)
+
+    def _load(self, record_ids, client=None):
+        """
+        Return the list of JSON-encoded records (None for missing ones)
+        """
+        client = client or self.redis
+        if self.storage != 'hash':
+            return client.mget([self._key('msg:{0}', _id)
+                                for _id in record_ids])
+        buckets = self._buckets(record_ids)
+        pipe = client.pipeline(transaction=False)
+        for bucket_key, ids in buckets.items():
+            pipe.hmget(bucket_key, ids)
+        found = {}
+        for ids, records in zip(buckets.values(), pipe.execute()):
+            found.update(zip(ids, records))
+        return [found[str(_id)] for _id in record_ids]
+
+    def _delete(self, pipe, record_ids):
+        if self.storage != 'hash':
+            pipe.delete(*[self._key('msg:{0}', _id) for _id in record_ids])
+            return
+        for bucket_key, ids in self._buckets(record_ids).items():
+            pipe.hdel(bucket_key, *ids)
+
+    def _bucket_key(self, _id):
+        return self._key('msgs:{0}', int(_id) // self.hash_bucket_size)
+
+    def _buckets(self, record_ids):
+        """
+        Group record ids by keys of hashes they are stored in
+        """
+        buckets = OrderedDict()
+        for _id in record_ids:
+            buckets.setdefault(self._bucket_key(_id), []).append(str(_id))
+        return buckets
+
+    def _unsave(self, pipe, record):
+        """
+        Add commands removing references to the log record from flows and
+        indexes to the pipeline
+        """
+        _id = record['id']
+        pipe.zrem(self._key('flow:__all__'), _id)
+        for tag in record['tags']:
+            pipe.zrem(self._key('flow:{0}', tag), _id)
+        for key, score in self._index_keys(record):
+            pipe.zrem(key, _id)
+
+    def _index_keys(self, record):
+        """
+        Return the list of (key, score) pairs of secondary indexes the record
+        belongs to
+
+        Every indexed attribute has the index by value, scored by timestamp
+        (`idx:<attr>:<value>`). Numeric attributes are also stored in the
+        index scored by value (`idxnum:<attr>`), used to query by ranges.
+        With the text index enabled, every word of the rendered message has
+        its index scored by timestamp (`tok:<word>`).
+        """
+        ret = []
+        for attr in self.indexed_attrs:
+            value = record['attrs'].get(attr)
+            if value is None or isinstance(value, (list, dict)):
+                continue
+            ret.append((self._key('idx:{0}:{1}', attr, value), record['ts']))
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                ret.append((self._key('idxnum:{0}', attr), value))
+        if self.text_index:
+            text = _render(record['message'], record['attrs'])
+            tokens = tokenize(text, self.stop_words)[:self.max_tokens]
+            for token in tokens:
+                ret.append((self._key('tok:{0}', token), record['ts']))
+        return ret
+
+    def _extend_attrs(self, tagging_attrs, attrs):
+        attrs = attrs.copy()
+        for tagging_attr in tagging_attrs:
+            attrs.update(tagging_attr.get_attrs())
+        attrs.update(self._context.attrs)
+        return attrs
+
+    def _extend_tags(self, tagging_attrs, tags):
+        ret = (tags or []) + self._context.tags
+        for tagging_attr in tagging_attrs:
+            ret += tagging_attr.get_tags()
+        return list(set(ret))
+
+    def _extend_expire(self, ts, expire):
+        if expire is None:
+            return None
+        if isinstance(expire, datetime.datetime):
+            return expire
+        if ts is None:
+            ts = datetime.datetime.now(UTC)
+        if isinstance(expire, datetime.timedelta):
+            return ts + expire
+        return ts + datetime.timedelta(seconds=expire)
+
+    def _resolve_tag(self, tag, kwargs):
+        if isinstance(tag, TaggingAttribute):
+            kwargs = tag.get_attrs()
+
+        if len(kwargs.keys()) > 1:
+            raise RuntimeError('Unable to filter for more than one tag. The '
+                               'filter expression is {0}'.format(kwargs))
+        elif len(kwargs.keys()) == 1:
+            key, value = list(kwargs.items())[0]
+            tag = '{0}:{1}'.format(key, value)
+        return tag
+
+    def get(self, tag='__all__', limit=None, min_ts=None, max_ts=None,
+            where=None, **kwargs):
+        tag = self._resolve_tag(tag, kwargs)
+        key = self._key('flow:{0}', tag)
+
+        max = _dt2ts(max_ts) if max_ts else float('inf')
+        min = _dt2ts(min_ts) if min_ts else 0
+        start = None if limit is None else 0
+
+        client = self._reader()
+        if where:
+            # queries store temporary keys, so they run on the primary
+            client = self.redis
+            record_ids = self._get_where(key, where, max, min, limit)
+        else:
+            record_ids = client.zrevrangebyscore(key, max, min,
+                                                 start=start, num=limit)
+        if not record_ids:
+            return []
+        record_ids = [_id.decode('utf-8') for _id in record_ids]
+        return self._get_records(record_ids, key, client)
+
+    def _get_where(self, key, where, max, min, limit, extra_keys=()):
+        """
+        Return ids of records of the flow, matching secondary index filters
+
+        Filters are resolved in Redis: the flow is intersected with indexes
+        by value (including `extra_keys`) and with temporary sets built from
+        numeric range indexes.
+        """
+        eq_keys = list(extra_keys)
+        range_keys = []
+        range_args = []
+        tmp_key = self._key('tmp:{0}', uuid.uuid4().hex)
+        for attr, value in sorted(where.items()):
+            if attr not in self.indexed_attrs:
+                raise RuntimeError('Attribute {0} is not indexed'.format(attr))
+            if isinstance(value, tuple):
+                low, high = value
+                range_keys += [self._key('idxnum:{0}', attr),
+                               '{0}:{1}'.format(tmp_key, attr)]
+                range_args += ['-inf' if low is None else low,
+                               '+inf' if high is None else high]
+            else:
+                eq_keys.append(self._key('idx:{0}:{1}', attr, value))
+        keys = [key, tmp_key] + eq_keys + range_keys
+        args = [max, min, '' if limit is None else limit,
+                len(eq_keys)] + range_args
+        return self._query(keys=keys, args=args)
+
+    def search(self, query, tag='__all__', min_ts=None, max_ts=None,
+               limit=None, where=None, **kwargs):
+        if not self.text_index:
+            raise RuntimeError('Text index is not enabled')
+        tokens = tokenize(query, self.stop_words)
+        if not tokens:
+            return []
+        tag = self._resolve_tag(tag, kwargs)
+        key = self._key('flow:{0}', tag)
+        max = _dt2ts(max_ts) if max_ts else float('inf')
+        min = _dt2ts(min_ts) if min_ts else 0
+        token_keys = [self._key('tok:{0}', token) for token in tokens]
+        record_ids = self._get_where(key, where or {}, max, min, limit,
+                                     token_keys)
+        if not record_ids:
+            return []
+        record_ids = [_id.decode('utf-8') for _id in record_ids]
+        return self._get_records(record_ids, key)
+
+    def _get_records(self, record_ids, key=None, client=None):
+        """
+        Return :class:`Log` objects for given record ids, fetching from Redis
+        (the primary or the `client`) only those which are not cached yet
+
+        Records removed from the store (expired by TTL, trimmed from capped
+        flows) are skipped, and their ids are removed from the flow or index
+        `key` in the background.
+        """
+        if self.cache is None:
+            records = self._load(record_ids, client)
+            dangling = [_id for _id, record in zip(record_ids, records)
+                        if record is None]
+            self._discard_dangling(key, dangling)
+            return decode_records([record for record in records
+                                   if record is not None])
+        record_keys = [self._key('msg:{0}', _id) for _id in record_ids]
+        found = self.cache.get_many(record_keys)
+        if self.expire_mode == 'ttl':
+            # Redis has removed records, which are still in the cache
+            now = time.time()
+            for cache_key, record in list(found.items()):
+                if record.record['expire'] and record.record['expire'] <= now:
+                    del found[cache_key]
+        missing = [(cache_key, _id) for cache_key, _id
+                   in zip(record_keys, record_ids) if cache_key not in found]
+        if missing:
+            dangling = []
+            records = self._load([_id for cache_key, _id in missing], client)
+            found_keys = []
+            for (cache_key, _id), record in zip(missing, records):
+                if record is not None:
+                    found_keys.append(cache_key)
+                else:
+                    dangling.append(_id)
+            fetched = dict(zip(found_keys, decode_records(
+                [record for record in records if record is not None])))
+            self.cache.put_many(fetched)
+            found.update(fetched)
+            self._discard_dangling(key, dangling)
+        return [found[cache_key] for cache_key in record_keys
+                if cache_key in found]
+
+    def _discard_dangling(self, key, record_ids):
+        if key is not None and record_ids:
+            self.compactor.discard(key, record_ids, self)
+            if self.cache is not None:
+                self.cache.discard([self._key('msg:{0}', _id)
+                                    for _id in record_ids])
+
+    def compact(self, batch_size=COMPACT_BATCH_SIZE):
+        return self.compactor.compact(batch_size)
+
+    def _missing(self, record_ids):
+        """
+        Return the list of ids of records, which are not in the store
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for _id in record_ids:
+            if self.storage == 'hash':
+                pipe.hexists(self._bucket_key(_id), _id)
+            else:
+                pipe.exists(self._key('msg:{0}', _id))
+        return [_id for _id, exists in zip(record_ids, pipe.execute())
+                if not exists]
+
+    def cache_stats(self):
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    def _invalidate(self, record_ids, client=None):
+        """
+        Evict records from the local cache and notify other processes
+
+        :param record_ids: list of record ids, or None to drop everything
+        :param client: Redis client to publish with, the primary by default
+        """
+        if self.cache is None:
+            return
+        if record_ids is None:
+            self.cache.clear()
+        else:
+            self.cache.discard([self._key('msg:{0}', _id) for _id in record_ids])
+        if self.cache_invalidation and not self._over_budget(client):
+            # past the budget, the record is already stored and must not go
+            # to the spool, so only other processes miss the notice
+            (client or self.redis).publish(get_cache_channel(self.prefix),
+                                           json.dumps(record_ids))
+
+    def get_latest(self, tag='__all__', **kwargs):
+        get_result = self.get(tag, limit=1, **kwargs)
+        return get_result and get_result[0]
+
+    def get_multi(self, prefixes, tag='__all__', min_ts=None, max_ts=None,
+                  limit=None, chunk_size=EXPORT_CHUNK_SIZE, **kwargs):
+        tag = self._resolve_tag(tag, kwargs)
+        max = _dt2ts(max_ts) if max_ts else float('inf')
+        min = _dt2ts(min_ts) if min_ts else 0
+        start = None if limit is None else 0
+        loggers = [self._for_prefix(prefix) for prefix in prefixes]
+        client = self._reader()
+        pipe = client.pipeline(transaction=False)
+        for logger in loggers:
+            pipe.zrevrangebyscore(logger._key('flow:{0}', tag), max, min,
+                                  start=start, num=limit, withscores=True)
+        flows = pipe.execute()
+
+        # k-way merge of flows by score, latest first
+        heap = [(-flow[0][1], i, 0) for i, flow in enumerate(flows) if flow]
+        heapq.heapify(heap)
+        merged = []
+        while heap and (limit is None or len(merged) < limit):
+            score, i, pos = heapq.heappop(heap)
+            merged.append((i, flows[i][pos][0].decode('utf-8')))
+            if pos + 1 < len(flows[i]):
+                heapq.heappush(heap, (-flows[i][pos + 1][1], i, pos + 1))
+
+        for chunk_start in range(0, len(merged), chunk_size):
+            chunk = merged[chunk_start:chunk_start + chunk_size]
+            found = {}
+            for i, logger in enumerate(loggers):
+                record_ids = [_id for j, _id in chunk if j == i]
+                if record_ids:
+                    key = logger._key('flow:{0}', tag)
+                    for record in logger._get_records(record_ids, key,
+                                                      client):
+                        found[i, str(record.id)] = record
+            for i, _id in chunk:
+                if (i, _id) in found:
+                    yield prefixes[i], found[i, _id]
+
+    def _for_prefix(self, prefix):
+        """
+        Return the logger sharing the connection, the cache and the
+        background workers with this one, but working with another prefix
+        """
+        prefix = prefix or ''
+        if prefix == self.prefix:
+            return self
+        logger = copy.copy(self)
+        logger.prefix = prefix
+        return logger
+
+    def get_since(self, tag='__all__', cursor=None, limit=None, max_ts=None,
+                  **kwargs):
+        tag = self._resolve_tag(tag, kwargs)
+        key = self._key('flow:{0}', tag)
+        max_score = _dt2ts(max_ts) if max_ts else float('inf')
+        client = self._reader()
+        items = self._range_since(key, cursor, max_score, limit, client)
+        if not items:
+            return [], cursor
+        records = self._get_records([str(_id) for score, _id in items], key,
+                                    client)
+        return records, make_cursor(*items[-1])
+
+    def _range_since(self, key, cursor, max_score, limit, client=None):
+        """
+        Return up to `limit` (score, id) pairs of the flow, which go after
+        the cursor, in the time order
+
+        Records with the same score are ordered by their ids, so that the
+        cursor never skips a record, even if it points to the middle of a
+        group of records logged within the same moment.
+        """
+        client = client or self.redis
+        start = None if limit is None else 0
+        if cursor is None:
+            cursor_score, last_id = None, None
+            min_score = '-inf'
+        else:
+            cursor_score, last_id = parse_cursor(cursor)
+            min_score = '({0!r}'.format(cursor_score)
+        pipe = client.pipeline(transaction=False)
+        if cursor is not None:
+            pipe.zrangebyscore(key, cursor_score, cursor_score, withscores=True)
+        pipe.zrangebyscore(key, min_score, max_score, start=start, num=limit,
+                           withscores=True)
+        results = pipe.execute()
+        page, groups = results[-1], results[:-1]
+        if limit is not None and len(page) == limit:
+            # Redis orders records with equal scores lexicographically, so
+            # the last group of the page may be incomplete. Fetch it entirely.
+            boundary = page[-1][1]
+            page = [item for item in page if item[1] != boundary]
+            groups.append(client.zrangebyscore(key, boundary, boundary,
+                                               withscores=True))
+        items = []
+        for group in [page] + groups:
+            for _id, score in group:
+                _id = int(_id)
+                if score > max_score:
+                    continue
+                if score == cursor_score and _id <= last_id:
+                    continue
+                items.append((score, _id))
+        items.sort()
+        if limit is not None:
+            items = items[:limit]
+        return items
+
+    def export(self, fileobj, tag='__all__', min_ts=None, max_ts=None,
+               chunk_size=EXPORT_CHUNK_SIZE, **kwargs):
+        tag = self._resolve_tag(tag, kwargs)
+        key = self._key('flow:{0}', tag)
+        max_score = _dt2ts(max_ts) if max_ts else float('inf')
+        # ids start from 1, so the cursor points right before min_ts
+        cursor = make_cursor(_dt2ts(min_ts), 0) if min_ts else None
+        count = 0
+        out = gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=6)
+        try:
+            while True:
+                items = self._range_since(key, cursor, max_score, chunk_size)
+                if not items:
+                    break
+                cursor = make_cursor(*items[-1])
+                for record in self._load([_id for score, _id in items]):
+                    if record is not None:
+                        out.write(record + b'\n')
+                        count += 1
+        finally:
+            out.close()
+        return count
+
+    def import_(self, fileobj, batch_size=IMPORT_BATCH_SIZE):
+        count = 0
+        max_id = 0
+        record_ids = []
+        pipe = self.redis.pipeline(transaction=False)
+        for line in gzip.GzipFile(fileobj=fileobj, mode='rb'):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line.decode('utf-8'))
+            self._save(pipe, record, line)
+            record_ids.append(record['id'])
+            max_id = max(max_id, record['id'])
+            count += 1
+            if len(record_ids) >= batch_size:
+                pipe.execute()
+                self._invalidate(record_ids)
+                record_ids = []
+        pipe.execute()
+        if record_ids:
+            self._invalidate(record_ids)
+        # new records must not overwrite imported ones
+        self._bump_counter(keys=[self._key('counter')], args=[max_id])
+        return count
+
+    def _tail_cursor(self, key):
+        client = self._reader()
+        items = client.zrevrange(key, 0, 0, withscores=True)
+        if not items:
+            return None
+        _id, score = items[0]
+        group = client.zrangebyscore(key, score, score)
+        return make_cursor(score, max(int(_id) for _id in group))
+
+    def _latest(self, key, limit, client):
+        """
+        Return up to `limit` latest (score, id) pairs of the flow, in the
+        time order
+
+        Like :meth:`_range_since`, fetches the group of records sharing the
+        score of the oldest returned one entirely, because Redis orders them
+        lexicographically.
+        """
+        start = None if limit is None else 0
+        page = client.zrevrangebyscore(key, '+inf', '-inf', start=start,
+                                       num=limit, withscores=True)
+        if limit is not None and len(page) == limit:
+            boundary = page[-1][1]
+            page = [item for item in page if item[1] != boundary]
+            page += client.zrangebyscore(key, boundary, boundary,
+                                         withscores=True)
+        items = sorted((score, int(_id)) for _id, score in page)
+        if limit is not None:
+            items = items[len(items) - limit:]
+        return items
+
+    def follow(self, tag='__all__', backlog=None, poll_interval=None,
+               overlap=FOLLOW_OVERLAP, **kwargs):
+        tag = self._resolve_tag(tag, kwargs)
+        key = self._key('flow:{0}', tag)
+        pubsub = None
+        if poll_interval is None:
+            # subscribe before the backfill, so that nothing gets lost on the
+            # seam between history and live updates
+            pubsub = self._reader().pubsub()
+            pubsub.subscribe(get_pubsub_channel(self.prefix))
+        try:
+            items = []
+            records = []
+            if backlog != 0:
+                client = self._reader()
+                items = self._latest(key, backlog, client)
+                records = self._get_records([str(_id) for score, _id in items],
+                                            key, client)
+            for record in records:
+                yield record
+            if poll_interval is not None:
+                for record in self._poll(key, items, poll_interval, overlap):
+                    yield record
+            seen = set(record.id for record in records)
+            for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                record = Log(message['data'])
+                if record.id in seen:
+                    seen.discard(record.id)
+                    continue
+                if tag == '__all__' or tag in record.tags:
+                    yield record
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+    def _poll(self, key, backlog, poll_interval, overlap):
+        """
+        Yield records added to the flow after the backlog of (score, id)
+        pairs, polling every `poll_interval` seconds
+
+        Writers take timestamps before their records reach Redis, so a slow
+        writer can add the record behind the latest seen one. Every poll
+        re-checks records within `overlap` seconds before the latest seen
+        one, skipping those which are yielded already.
+        """
+        if backlog:
+            # the cursor points to the latest record of the backlog, even if
+            # some of them have been removed meanwhile
+            cursor = backlog[-1]
+        else:
+            cursor = self._tail_cursor(key)
+            cursor = cursor and parse_cursor(cursor)
+        seen = {}
+        if cursor is not None and overlap:
+            # records older than the cursor are known already
+            seen = dict((_id, score) for score, _id in self._range_since(
+                key, make_cursor(cursor[0] - overlap, 0), cursor[0], None)
+                if (score, _id) <= cursor)
+        while True:
+            since = None
+            if cursor is not None:
+                since = make_cursor(*cursor)
+                if overlap:
+                    since = make_cursor(cursor[0] - overlap, 0)
+            client = self._reader()
+            items = [item for item in self._range_since(
+                key, since, float('inf'), None, client)
+                if item[1] not in seen]
+            if not items:
+                time.sleep(poll_interval)
+                continue
+            for record in self._get_records([str(_id) for score, _id in items],
+                                            key, client):
+                yield record
+            seen.update((_id, score) for score, _id in items)
+            cursor = max([cursor] + items) if cursor else items[-1]
+            for _id, score in list(seen.items()):
+                if score < cursor[0] - overlap:
+                    del seen[_id]
+
+    def _reader(self):
+        """
+        Return Redis client for read-only commands: one of replicas, if any
+        of them is available, or the primary
+        """
+        if self.replicas is None:
+            return self.redis
+        if self.read_your_writes:
+            last_write = getattr(self._context, 'last_write', None)
+            if (last_write is not None and
+                    time.time() - last_write < self.read_your_writes):
+                return self.redis
+        return self.replicas.client() or self.redis
+
+    def _id(self, client=None):
+        cnt = self._key('counter')
+        return (client or self.redis).incr(cnt)
+
+    def _key(self, key, *args, **kwargs):
+        return get_key(self.prefix, key, *args, **kwargs)
+
+    @contextmanager
+    def context(self, *tags, **attrs):
+        self.ensure_context()
+        old_tags = copy.copy(self._context.tags)
+        old_attrs = self._context.attrs.copy()
+        for tag in tags:
+            if isinstance(tag, TaggingAttribute):
+                self._context.tags += tag.get_tags()
+                self._context.attrs.update(tag.get_attrs())
+            else:
+                self._context.tags.append(tag)
+        self._context.attrs.update(attrs)
+        try:
+            yield
+        finally:
+            self._context.tags = old_tags
+            self._context.attrs = old_attrs
+
+    def add_tags(self, *tags):
+        self.ensure_context()
+        for tag in tags:
+            if tag not in self._context.tags:
+                self._context.tags.append(tag)
+
+    def rm_tags(self, *tags):
+        self.ensure_context()
+        for tag in tags:
+            if tag in self._context.tags:
+                self._context.tags.remove(tag)
+
+    def add_attrs(self, **attrs):
+        self.ensure_context()
+        self._context.attrs.update(attrs)
+
+    def rm_attrs(self, *attrs):
+        self.ensure_context()
+        for attr in attrs:
+            self._context.attrs.pop(attr, None)
+
+    def add_tagging_attrs(self, *tagging_attrs, **kwargs):
+        if kwargs:
+            tagging_attrs = list(tagging_attrs) + [TaggingAttribute(**kwargs)]
+        for tagging_attr in tagging_attrs:
+            self.add_tags(*tagging_attr.get_tags())
+            self.add_attrs(**tagging_attr.get_attrs())
+
+    def rm_tagging_attrs(self, *tagging_attrs, **kwargs):
+        if kwargs:
+            tagging_attrs = list(tagging_attrs) + [TaggingAttribute(**kwargs)]
+        for tagging_attr in tagging_attrs:
+            self.rm_tags(*tagging_attr.get_tags())
+            self.rm_attrs(*tagging_attr.get_attrs().keys())
+
+    def reset_context(self):
+        self._context.attrs = {}
+        self._context.tags = []
+
+    def subscribe(self):
+        self.ensure_context()
+        pubsub_channel = self._key('log-records')
+        self._context.pubsub.subscribe(pubsub_channel)
+
+    def unsubscribe(self):
+        self.ensure_context()
+        self._context.pubsub.unsubscribe()
+
+    def listen(self):
+        self.ensure_context()
+        for message in self._context.pubsub.listen():
+            if message['type'] == 'message':
+                data = message['data']
+                yield Log(data)
+
+    def expire(self, archive_func=None, ts=None):
+        ts = _dt2ts(ts) if ts else time.time()
+        flow_expire = self._key('flow:__expire__')
+
+        record_ids = self.redis.zrevrangebyscore(flow_expire, ts, 0)
+        if not record_ids:
+            return 0
+        record_ids = [_id.decode('utf-8') for _id in record_ids]
+        records = decode_records([record for record in self._load(record_ids)
+                                  if record is not None])
+        if not (archive_func and callable(archive_func)):
+            archive_func = self.archive_func
+        if archive_func and callable(archive_func):
+            # archive sinks accept the whole batch of records at once
+            archive_batch = getattr(archive_func, 'archive_batch', None)
+            if archive_batch is not None:
+                archive_batch(records)
+            else:
+                for record_obj in records:
+                    archive_func(record_obj)
+        pipe = self.redis.pipeline()
+        for record_obj in records:
+            self._unsave(pipe, record_obj.record)
+        pipe.zremrangebyscore(flow_expire, 0, ts)
+        self._delete(pipe, record_ids)
+        pipe.execute()
+        self._invalidate(record_ids)
+        return len(records)
+
+
+class ReplicaPool(object):
+    """
+    Redis replicas serving read-only commands
+
+    Replicas are picked in turn ("round-robin" selection), or the one with
+    the lowest latency is picked ("latency" selection). Latencies are
+    measured with PING when the pool is created, and then once in
+    `probe_interval` seconds in the daemon thread, so that readers never
+    wait for probes. Replicas which don't respond are not picked until the
+    next probe.
+    """
+
+    def __init__(self, clients, selection='round-robin',
+                 probe_interval=REPLICA_PROBE_INTERVAL):
+        self.clients = clients
+        self.selection = selection
+        self.probe_interval = probe_interval
+        self.latencies = [None] * len(clients)
+        self._turn = 0
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._probe()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def client(self):
+        """
+        Return the client of the replica to send a command to, or None if
+        none of replicas is available
+        """
+        latencies = self.latencies
+        available = [i for i, latency in enumerate(latencies)
+                     if latency is not None]
+        if not available:
+            return None
+        if self.selection == 'latency':
+            index = min(available, key=latencies.__getitem__)
+        else:
+            with self._lock:
+                self._turn += 1
+                index = available[self._turn % len(available)]
+        return self.clients[index]
+
+    def stop(self):
+        self._stopped = True
+
+    def _run(self):
+        while not self._stopped:
+            time.sleep(self.probe_interval)
+            if not self._stopped:
+                self._probe()
+
+    def _probe(self):
+        latencies = list(self.latencies)
+        for i, client in enumerate(self.clients):
+            start = time.time()
+            try:
+                client.ping()
+            except redis.RedisError:
+                latencies[i] = None
+                continue
+            latency = time.time() - start
+            if latencies[i] is None:
+                latencies[i] = latency
+            else:
+                # exponentially weighted moving average
+                latencies[i] = 0.7 * latencies[i] + 0.3 * latency
+        self.latencies = latencies
+
+
+class RateLimiter(object):
+    """
+    Sampling and token bucket rate limits for log records, by their tags
+
+    Every tag has its own bucket, even if the limit is set for the key of
+    the tagging attribute, so that every "ip:<addr>" tag is limited on its
+    own. The record is stored only if all its tags let it through, and
+    dropped records are counted by the setting which has dropped them. Tokens
+    are taken only from buckets of stored records, so that a flood of
+    records dropped by one tag doesn't use up limits of other tags.
+    """
+
+    def __init__(self, logger, sampling, rate_limits, scope, report_interval):
+        self.logger = logger
+        self.sampling = sampling
+        self.rate_limits = rate_limits
+        self.scope = scope
+        self.report_interval = report_interval
+        self.suppressed = {}
+        self._buckets = OrderedDict()
+        self._last_report = time.time()
+        self._lock = threading.Lock()
+
+    def allow(self, tags):
+        for tag in tags:
+            rate = tag_setting(self.sampling, tag)
+            if rate is not None and random.random() >= rate:
+                self._suppress(tag, self.sampling)
+                return False
+        limits = [(tag, tag_setting(self.rate_limits, tag)) for tag in tags]
+        limits = [(tag, limit) for tag, limit in limits if limit is not None]
+        if not limits:
+            return True
+        if self.scope == 'cluster':
+            rejected = self._take_cluster(limits)
+        else:
+            rejected = self._take(limits)
+        if rejected is not None:
+            self._suppress(rejected, self.rate_limits)
+            return False
+        return True
+
+    def _take(self, limits):
+        """
+        Take a token from buckets of all tags, if every one of them has it
+
+        :param limits: list of (tag, (rate, burst)) pairs
+        :return: the tag, which has dropped the record, or None
+        """
+        now = time.time()
+        rejected = None
+        with self._lock:
+            buckets = []
+            for tag, (rate, burst) in limits:
+                tokens, last = self._buckets.pop(tag, (burst, now))
+                tokens = min(burst, tokens + (now - last) * rate)
+                if tokens < 1 and rejected is None:
+                    rejected = tag
+                buckets.append((tag, tokens))
+            for tag, tokens in buckets:
+                if rejected is None:
+                    tokens -= 1
+                self._buckets[tag] = (tokens, now)
+            while len(self._buckets) > MAX_RATE_BUCKETS:
+                self._buckets.popitem(last=False)
+        return rejected
+
+    def _take_cluster(self, limits):
+        spool = self.logger.spool
+        if spool is not None and spool.opened:
+            # Redis is not available, let the record go to the spool
+            return None
+        second = int(time.time())
+        keys = [self.logger._key('ratelimit:{0}:{1}', tag, second)
+                for tag, limit in limits]
+        args = [rate for tag, (rate, burst) in limits]
+        client = self.logger.redis if spool is None else spool.client
+        try:
+            self.logger._check_budget(client)
+            index = self.logger._rate_limit(keys=keys, args=args,
+                                            client=client)
+        except redis.RedisError:
+            if spool is None:
+                raise
+            spool.opened = True
+            return None
+        return limits[index - 1][0] if index else None
+
+    def _suppress(self, tag, settings):
+        # count by the key of the setting, so that a storm of "ip:<addr>"
+        # tags adds up to one "ip" counter, and there are no more counters
+        # than settings
+        if tag not in settings:
+            tag = tag.split(':', 1)[0]
+        with self._lock:
+            self.suppressed[tag] = self.suppressed.get(tag, 0) + 1
+
+    def pop_suppressed(self):
+        """
+        Return the dict of dropped record counts by keys of settings, which
+        have dropped them, and reset it, once per report interval
+        """
+        now = time.time()
+        if now - self._last_report < self.report_interval:
+            return None
+        with self._lock:
+            suppressed, self.suppressed = self.suppressed, {}
+            self._last_report = now
+        return suppressed
+
+
+class FlowCompactor(object):
+    """
+    Remove references to records, which are not in the store anymore, from
+    flows and indexes
+
+    References found by readers are removed in the daemon thread, so that
+    readers don't wait for it. Besides, :meth:`compact` walks over flows and
+    indexes step by step, checking their oldest records.
+    """
+
+    def __init__(self, logger, interval=None):
+        self.logger = logger
+        self.interval = interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._patterns = list(COMPACT_PATTERNS)
+        self._cursor = 0
+        if interval is not None:
+            self._start()
+
+    def discard(self, key, record_ids, logger=None):
+        """
+        Remove references to records from the flow or index in the daemon
+        thread
+
+        :param logger: logger, which has found the references, the one of
+                       the compactor by default. Loggers of other prefixes
+                       share the compactor with it.
+        """
+        self._queue.put((logger or self.logger, key, record_ids))
+        self._start()
+
+    def join(self):
+        """
+        Wait until all discarded references are removed
+        """
+        self._queue.join()
+
+    def stop(self):
+        self._stopped = True
+        self._queue.put(None)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        next_compact = None
+        if self.interval is not None:
+            next_compact = time.time() + self.interval
+        while not self._stopped:
+            timeout = None
+            if next_compact is not None:
+                timeout = max(0, next_compact - time.time())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            try:
+                if item is not None:
+                    logger, key, record_ids = item
+                    if logger.replicas is not None:
+                        # don't trust replicas: they can be out of sync
+                        record_ids = logger._missing(record_ids)
+                    if record_ids:
+                        logger.redis.zrem(key, *record_ids)
+                if next_compact is not None and time.time() >= next_compact:
+                    self.compact()
+                    next_compact = time.time() + self.interval
+            except redis.RedisError:
+                pass
+            finally:
+                if item is not None:
+                    self._queue.task_done()
+
+    def compact(self, batch_size=COMPACT_BATCH_SIZE):
+        """
+        Make one step of compaction: check `batch_size` oldest records of
+        every flow or index returned by the next SCAN call, and remove
+        references to missing ones
+
+        :return: the amount of removed references
+        """
+        logger = self.logger
+        removed = 0
+        with self._lock:
+            pattern = logger._key(self._patterns[0])
+            self._cursor, keys = logger.redis.scan(self._cursor, match=pattern,
+                                                   count=batch_size)
+            if self._cursor == 0:
+                self._patterns.append(self._patterns.pop(0))
+            for key in keys:
+                record_ids = [_id.decode('utf-8') for _id
+                              in logger.redis.zrange(key, 0, batch_size - 1)]
+                missing = logger._missing(record_ids)
+                if missing:
+                    removed += logger.redis.zrem(key, *missing)
+        return removed
+
+
+class LogCache(object):
+    """
+    Bounded LRU cache of decoded log records, keyed by their Redis keys
+
+    Log records don't change after they are written, except for occurrence
+    counters of deduplicated records, so a cached record is valid until it
+    expires, gets a new occurrence, or the store is cleaned up. Changes made
+    by other processes are seen only with cache invalidation enabled.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._pubsub = None
+
+    def get_many(self, keys):
+        ret = {}
+        with self._lock:
+            for key in keys:
+                value = self._data.pop(key, None)
+                if value is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                self._data[key] = value
+                ret[key] = value
+        return ret
+
+    def put_many(self, items):
+        with self._lock:
+            for key, value in items.items():
+                self._data.pop(key, None)
+                self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._data), 'maxsize': self.maxsize}
+
+    def listen(self, pubsub, channel, key_func):
+        """
+        Start the daemon thread evicting records on invalidation notices
+
+        :param pubsub: redis pubsub object, used exclusively by the cache
+        :param channel: invalidation channel name
+        :param key_func: function building record key by the template and
+                         record id
+        """
+        self._pubsub = pubsub
+        pubsub.subscribe(channel)
+        thread = threading.Thread(target=self._listen, args=(pubsub, key_func))
+        thread.daemon = True
+        thread.start()
+
+    def _listen(self, pubsub, key_func):
+        try:
+            for message in pubsub.listen():
+                if self._pubsub is not pubsub:
+                    break
+                if message['type'] != 'message':
+                    continue
+                record_ids = json.loads(message['data'].decode('utf-8'))
+                if record_ids is None:
+                    self.clear()
+                else:
+                    self.discard([key_func('msg:{0}', _id) for _id in record_ids])
+        except redis.ConnectionError:
+            pass
+        except Exception:
+            # the connection is closed under the reader by close()
+            if self._pubsub is pubsub:
+                raise
+
+    def close(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            pubsub.close()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Log records and helpers to encode, decode and format them
+
+The module doesn't depend on Redis, so that it's cheap to import.
+"""
+import datetime
+import json
+from string import Formatter
+from .constants import MISSING_KEY, MAX_TOKEN_LENGTH, TOKEN_RE, STOP_WORDS
+
+try:
+    UTC = datetime.timezone.utc
+except AttributeError:  # python 2
+    import pytz
+    UTC = pytz.utc
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=UTC)
+EPOCH_NAIVE = datetime.datetime(1970, 1, 1)
+
+
+class TaggingAttribute(object):
+
+    def __init__(self, **attrs):
+        self.attrs = attrs
+
+    def get_tags(self):
+        return ['{0}:{1}'.format(*kv) for kv in self.attrs.items()]
+
+    def get_attrs(self):
+        return self.attrs
+
+
+ta = TaggingAttribute
+
+
+class Log(object):
+
+
+    def __init__(self, record_str):
+        self._load(json.loads(record_str.decode('utf-8')))
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Return the log record for the already decoded dict
+        """
+        log = cls.__new__(cls)
+        log._load(record)
+        return log
+
+    def _load(self, record):
+        fromtimestamp = datetime.datetime.fromtimestamp
+        self.id = record['id']
+        self.message = record['message']
+        self.attrs = record['attrs']
+        self.tags = record['tags']
+        self.ts = fromtimestamp(record['ts'], UTC)
+        # occurrence counters of deduplicated records
+        self.count = record.get('count', 1)
+        self.first_ts = self.ts
+        if 'last_ts' in record:
+            self.last_ts = fromtimestamp(record['last_ts'], UTC)
+        else:
+            self.last_ts = self.ts
+        if record['expire']:
+            self.expire = fromtimestamp(record['expire'], UTC)
+        else:
+            self.expire = None
+        self.record = record
+
+    def __str__(self):
+        formatter = LogFormatter()
+        return str(formatter.vformat(self.message, (), self.attrs))
+
+    def matches(self, query, stop_words=STOP_WORDS):
+        """
+        Return True if the rendered record contains all words of the query
+        """
+        words = set(tokenize(_render(self.message, self.attrs), stop_words))
+        return set(tokenize(query, stop_words)) <= words
+
+    def __unicode__(self):
+        formatter = LogFormatter()
+        return unicode(formatter.vformat(self.message, (), self.attrs))
+
+    def __repr__(self):
+        return '<Log@%s: %r attrs=%r tags=%r>' % (self.ts, self.message,
+                                                  self.attrs, self.tags)
+
+    @property
+    def cursor(self):
+        """
+        Opaque cursor pointing to this record, to be passed to
+        :func:`get_since`
+        """
+        return make_cursor(self.record['ts'], self.id)
+
+
+class LogFormatter(Formatter):
+
+    def get_value(self, key, args, kwargs):
+        try:
+            return Formatter.get_value(self, key, args, kwargs)
+        except KeyError:
+            return MISSING_KEY
+
+    def check_unused_args(self, used_args, args, kwargs):
+        self.unused_args = {}
+        for k, v in kwargs.items():
+            if k not in used_args:
+                self.unused_args[k] = v
+
+    def vformat(self, format_string, args, kwargs):
+        self.unused_args = {}
+        ret = Formatter.vformat(self, format_string, args, kwargs)
+        if not self.unused_args:
+            return ret
+        extra_data =  ', '.join('{0}={1}'.format(*kv) for kv in self.unused_args.items())
+        return '{0} ({1})'.format(ret, extra_data)
+
+def _render(message, attrs):
+    """
+    Return the log message, interpolated with attributes
+    """
+    try:
+        return LogFormatter().vformat(message, (), attrs)
+    except Exception:
+        # malformed format string or attrs which don't fit it, index the
+        # message and attrs as is: indexing must never fail the write
+        return ' '.join([message] + ['{0}={1}'.format(*kv)
+                                     for kv in attrs.items()])
+
+
+def tokenize(text, stop_words=STOP_WORDS):
+    """
+    Split text to the list of distinct lowercase words, as they are indexed
+
+    Single characters, stop words and too long words are skipped.
+    """
+    ret = []
+    seen = set()
+    for token in TOKEN_RE.findall(text.lower()):
+        if len(token) < 2 or len(token) > MAX_TOKEN_LENGTH:
+            continue
+        if token in stop_words or token in seen:
+            continue
+        seen.add(token)
+        ret.append(token)
+    return ret
+
+
+def decode_records(record_strs):
+    """
+    Return the list of :class:`Log` objects for JSON-encoded records
+
+    Records are decoded as one JSON array, which is much faster than
+    decoding them one by one.
+    """
+    if not record_strs:
+        return []
+    records = json.loads((b'[' + b','.join(record_strs) + b']').decode('utf-8'))
+    return [Log.from_record(record) for record in records]
+
+
+def _dt2ts(dt):
+    """
+    Convert datetime objects to correct timestamps
+
+    Consider naive datetimes as UTC ones
+    """
+    if dt is None:
+        return dt
+    if dt.tzinfo is None:
+        delta = dt - EPOCH_NAIVE
+    else:
+        delta = dt - EPOCH
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def get_key(prefix, key, *args, **kwargs):
+    """
+    Return formatted variant of the Redis key
+
+    :param prefix: redis client prefix
+    :param key: key name
+    :param \*args: arguments to format key
+    :param \*\*kwargs: kwargs to format key
+    :return: string object with formatted key
+    """
+    if prefix:
+        template = '{0}:{1}'.format(prefix, key)
+    else:
+        template = key
+    if args or kwargs:
+        template = template.format(*args, **kwargs)
+    return template
+
+def tag_setting(settings, tag, default=None):
+    """
+    Return the setting for the tag from the dict, keyed by tags or by keys of
+    tagging attributes (so that "ip" matches "ip:127.0.0.1" tag)
+    """
+    if tag in settings:
+        return settings[tag]
+    key = tag.split(':', 1)[0]
+    if key != tag and key in settings:
+        return settings[key]
+    return default
+
+
+def make_cursor(score, record_id):
+    """
+    Return opaque cursor for :func:`get_since`, pointing to the record
+
+    :param score: record timestamp, as it is stored in flows
+    :param record_id: record id
+    """
+    return '{0!r}:{1}'.format(float(score), record_id)
+
+
+def parse_cursor(cursor):
+    """
+    Return (score, record_id) tuple, encoded in the cursor
+    """
+    score, record_id = cursor.rsplit(':', 1)
+    return float(score), int(record_id)
+
+
+def get_cache_channel(prefix):
+    """
+    Return key for pubsub channel, used to invalidate record caches
+    :param prefix: redis client prefix
+    :return: string with pubsub channel name
+    """
+    return get_key(prefix, 'cache-invalidate')
+
+
+def get_pubsub_channel(prefix):
+    """
+    Return key for pubsub channel, used by tagged-logger
+    :param prefix: redis client prefix
+    :return: string with pubsub channel name
+    """
+    return get_key(prefix, 'log-records')
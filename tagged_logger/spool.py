@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Local disk spool for log records, which can't be written to Redis in time
+
+When a write to Redis fails or takes longer than the latency budget, the
+record is appended to a segment file in the spool directory, and the spool
+"opens the circuit": further records go straight to the disk, without
+waiting for Redis. The daemon thread checks Redis once in `retry_interval`
+seconds and, as soon as it responds, replays segments in bulk, with the
+original timestamps of records. Once the spool is drained, records go to
+Redis again.
+
+Segments are named `<timestamp>-<pid>-<key>.open` while they are written,
+and renamed to `<timestamp>-<pid>-<key>.ndjson` once they are closed. The
+key stands for the prefix and the Redis server records are written to, so
+that loggers of different prefixes can share the spool directory: every
+logger replays only segments with its own key. Segments are claimed for
+replay by renaming, and segments left by dead processes are picked up by
+live ones.
+"""
+import os
+import errno
+import hashlib
+import json
+import time
+import threading
+import redis
+from .constants import SPOOL_TIMEOUT, SPOOL_RETRY_INTERVAL
+
+SPOOL_SEGMENT_SIZE = 4 * 1024 * 1024
+SPOOL_BATCH_SIZE = 1000
+
+
+class DiskSpool(object):
+    """
+    Write path of the logger, falling back to append-only segment files
+
+    :param logger: :class:`tagged_logger.Logger` instance
+    :param directory: directory to store segment files in
+    :param client: Redis client for writes, with the socket timeout set to
+                   the latency budget
+    :param retry_interval: amount of seconds between attempts to replay
+                           the spool
+    :param timeout: latency budget of the whole write, in seconds
+    :param segment_size: maximum size of the segment file, in bytes
+    :param batch_size: amount of records written within one pipeline on
+                       replay
+    """
+
+    def __init__(self, logger, directory, client,
+                 retry_interval=SPOOL_RETRY_INTERVAL, timeout=SPOOL_TIMEOUT,
+                 segment_size=SPOOL_SEGMENT_SIZE, batch_size=SPOOL_BATCH_SIZE):
+        self.logger = logger
+        self.directory = directory
+        self.client = client
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self.segment_size = segment_size
+        self.batch_size = batch_size
+        self.key = _segment_key(logger.prefix, client)
+        self.opened = False
+        self._file = None
+        self._path = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stopped = False
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._recover()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def start(self):
+        """
+        Start the latency budget of the write in the current thread
+        """
+        self._local.deadline = time.time() + self.timeout
+
+    def expired(self):
+        """
+        Return True if the write in the current thread has spent its latency
+        budget
+        """
+        deadline = getattr(self._local, 'deadline', None)
+        return deadline is not None and time.time() > deadline
+
+    def write(self, record):
+        """
+        Write the record (dict without id) to Redis, or to the spool, if
+        Redis is not available
+        """
+        if not self.opened:
+            try:
+                self.logger._put(record, self.client)
+                return
+            except redis.RedisError:
+                self.opened = True
+        self._append(record)
+
+    def pending(self):
+        """
+        Return the list of paths of closed segments waiting for replay
+        """
+        suffix = '-{0}.ndjson'.format(self.key)
+        return [os.path.join(self.directory, name)
+                for name in sorted(os.listdir(self.directory))
+                if name.endswith(suffix)]
+
+    def replay(self):
+        """
+        Write all spooled records to Redis, and close the circuit once the
+        spool is empty
+
+        :return: the amount of replayed records
+        """
+        with self._lock:
+            self._close_segment()
+        count = 0
+        for path in self.pending():
+            claimed = '{0}.replay-{1}'.format(path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                # replayed by another process
+                continue
+            count += self._replay_segment(claimed, path)
+        with self._lock:
+            if self._file is None and not self.pending():
+                self.opened = False
+        return count
+
+    def _replay_segment(self, claimed, path):
+        with open(claimed, 'rb') as fd:
+            records = [json.loads(line.decode('utf-8'))
+                       for line in fd if line.strip()]
+        done = 0
+        try:
+            while done < len(records):
+                batch = records[done:done + self.batch_size]
+                self.logger._put_many(batch)
+                done += len(batch)
+        except redis.RedisError:
+            # put the rest back, so that nothing gets lost or duplicated
+            with open(claimed + '.tmp', 'wb') as fd:
+                for record in records[done:]:
+                    fd.write(json.dumps(record).encode('utf-8') + b'\n')
+            os.rename(claimed + '.tmp', path)
+            os.remove(claimed)
+            raise
+        os.remove(claimed)
+        return done
+
+    def stop(self):
+        self._stopped = True
+        with self._lock:
+            self._close_segment()
+
+    def _append(self, record):
+        line = json.dumps(record).encode('utf-8') + b'\n'
+        with self._lock:
+            if self._file is None:
+                self._path = os.path.join(
+                    self.directory, '{0:017.6f}-{1}-{2}'.format(
+                        time.time(), os.getpid(), self.key))
+                self._file = open(self._path + '.open', 'ab')
+            self._file.write(line)
+            self._file.flush()
+            if self._file.tell() >= self.segment_size:
+                self._close_segment()
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            os.rename(self._path + '.open', self._path + '.ndjson')
+            self._file = None
+            self._path = None
+
+    def _recover(self):
+        """
+        Close segments with the key of the spool, left by dead processes
+        """
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('-{0}.open'.format(self.key)):
+                pid = name.split('-')[1]
+                if not _alive(int(pid)):
+                    os.rename(path, path[:-len('.open')] + '.ndjson')
+            elif '-{0}.ndjson.replay-'.format(self.key) in name:
+                segment, pid = path.rsplit('.replay-', 1)
+                if pid.isdigit() and not _alive(int(pid)):
+                    os.rename(path, segment)
+
+    def _run(self):
+        while not self._stopped:
+            time.sleep(self.retry_interval)
+            if not self.opened and not self.pending():
+                continue
+            try:
+                self.client.ping()
+                self.replay()
+            except (redis.RedisError, OSError):
+                pass
+
+
+def _segment_key(prefix, client):
+    """
+    Return the key of segments with records for the prefix on the Redis
+    server of the client
+    """
+    kwargs = client.connection_pool.connection_kwargs
+    target = [prefix] + [kwargs.get(name)
+                         for name in ('host', 'port', 'path', 'db')]
+    return hashlib.sha1(json.dumps(target).encode('utf-8')).hexdigest()[:16]
+
+
+def _alive(pid):
+    """
+    Return True if the process with given pid is running
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
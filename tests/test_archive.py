@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import os
+import gzip
+import json
+import sqlite3
+import datetime
+import tagged_logger
+from tagged_logger.archive import NDJSONArchive, SQLiteArchive
+from .tools import setup_function, teardown_function, configure
+
+
+def _log_expired(count):
+    for i in range(count):
+        tagged_logger.log('message {0}'.format(i), tags=['foo'],
+                          ts=datetime.datetime(2012, 1, 1), expire=1)
+
+
+def test_ndjson_archive(tmpdir):
+    sink = NDJSONArchive(str(tmpdir))
+    _log_expired(3)
+    assert tagged_logger.expire(archive_func=sink) == 3
+    sink.close()
+    with gzip.open(sink.path) as fd:
+        records = [json.loads(line.decode('utf-8')) for line in fd]
+    assert sorted(r['message'] for r in records) == [
+        'message 0', 'message 1', 'message 2']
+    assert records[0]['tags'] == ['foo']
+
+
+def test_ndjson_archive_rotation(tmpdir):
+    sink = NDJSONArchive(str(tmpdir), max_bytes=1)
+    configure(archive_func=sink)
+    _log_expired(1)
+    tagged_logger.expire()
+    _log_expired(1)
+    tagged_logger.expire()
+    sink.close()
+    assert len(os.listdir(str(tmpdir))) == 2
+
+
+def test_sqlite_archive(tmpdir):
+    path = str(tmpdir.join('archive.db'))
+    sink = SQLiteArchive(path)
+    _log_expired(3)
+    tagged_logger.log('bar', ts=datetime.datetime(2012, 1, 1), expire=1)
+    tagged_logger.expire(archive_func=sink)
+    sink.close()
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT count(*) FROM archive').fetchone() == (4, )
+    rows = conn.execute('SELECT r.message FROM archive r '
+                        'JOIN archive_tags t ON t.record_id = r.id '
+                        'WHERE t.tag = ? ORDER BY r.id', ('foo', )).fetchall()
+    assert rows == [('message 0', ), ('message 1', ), ('message 2', )]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import time
+import datetime
+import tagged_logger
+from .tools import (setup_function, teardown_function, redis_kwargs, prefix,
+                    configure)
+
+
+def test_cache_hits():
+    configure(cache_size=10)
+    tagged_logger.log('foo')
+    tagged_logger.log('bar')
+    first = tagged_logger.get()
+    assert tagged_logger.cache_stats()['misses'] == 2
+    tagged_logger.log('baz')
+    second = tagged_logger.get()
+    stats = tagged_logger.cache_stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 3
+    assert [str(r) for r in second] == ['baz', 'bar', 'foo']
+    assert second[1] is first[0]
+
+
+def test_cache_disabled():
+    tagged_logger.log('foo')
+    tagged_logger.get()
+    assert tagged_logger.cache_stats() is None
+
+
+def test_cache_is_bounded():
+    configure(cache_size=2)
+    for i in range(5):
+        tagged_logger.log('message {0}'.format(i))
+    assert len(tagged_logger.get()) == 5
+    assert tagged_logger.cache_stats()['size'] == 2
+
+
+def test_cache_expire():
+    configure(cache_size=10)
+    tagged_logger.log('foo', ts=datetime.datetime(2012, 1, 1), expire=1)
+    tagged_logger.get()
+    assert tagged_logger.cache_stats()['size'] == 1
+    tagged_logger.expire()
+    assert tagged_logger.cache_stats()['size'] == 0
+
+
+def test_cache_full_cleanup():
+    configure(cache_size=10)
+    tagged_logger.log('foo')
+    tagged_logger.get()
+    tagged_logger.full_cleanup()
+    tagged_logger.log('bar')
+    assert str(tagged_logger.get_latest()) == 'bar'
+
+
+def test_cache_invalidation():
+    reader = tagged_logger.Logger(prefix=prefix, cache_size=10,
+                                  cache_invalidation=True, **redis_kwargs)
+    writer = tagged_logger.Logger(prefix=prefix, cache_size=10,
+                                  cache_invalidation=True, **redis_kwargs)
+    try:
+        time.sleep(0.1)
+        writer.log('foo', ts=datetime.datetime(2012, 1, 1), expire=1)
+        reader.get()
+        assert reader.cache_stats()['size'] == 1
+        writer.expire()
+        time.sleep(0.1)
+        assert reader.cache_stats()['size'] == 0
+    finally:
+        reader.cache.close()
+        writer.cache.close()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import datetime
+import tagged_logger
+from .tools import setup_function, teardown_function, prefix, configure
+
+
+def test_max_len():
+    logger = configure(flow_caps={'foo': {'max_len': 2}})
+    for i in range(3):
+        tagged_logger.log('foo {0}'.format(i), tags=['foo'])
+    assert [str(r) for r in tagged_logger.get('foo')] == ['foo 2', 'foo 1']
+    # the record is still in the "__all__" flow
+    assert len(tagged_logger.get()) == 3
+    assert logger.redis.exists(prefix + ':msg:1')
+
+
+def test_max_len_reclaims_records():
+    logger = configure(flow_caps={'foo': {'max_len': 2},
+                                  '__all__': {'max_len': 2}})
+    for i in range(3):
+        tagged_logger.log('foo {0}'.format(i), tags=['foo'],
+                          expire=datetime.datetime(2100, 1, 1))
+    assert [str(r) for r in tagged_logger.get()] == ['foo 2', 'foo 1']
+    assert not logger.redis.exists(prefix + ':msg:1')
+    assert logger.redis.zcard(prefix + ':flow:__expire__') == 2
+
+
+def test_tagging_attr_cap():
+    configure(flow_caps={'ip': {'max_len': 1}})
+    tagged_logger.log('foo', tagged_logger.ta(ip='127.0.0.1'))
+    tagged_logger.log('bar', tagged_logger.ta(ip='127.0.0.1'))
+    tagged_logger.log('baz', tagged_logger.ta(ip='127.0.0.2'))
+    assert len(tagged_logger.get(ip='127.0.0.1')) == 1
+    assert len(tagged_logger.get(ip='127.0.0.2')) == 1
+
+
+def test_default_max_age():
+    logger = configure(default_flow_cap={'max_age': 3600}, storage='hash')
+    tagged_logger.log('old', ts=datetime.datetime(2012, 1, 1), tags=['foo'])
+    tagged_logger.log('new', tags=['foo'])
+    assert [str(r) for r in tagged_logger.get('foo')] == ['new']
+    assert [str(r) for r in tagged_logger.get()] == ['new']
+    assert logger.redis.hkeys(prefix + ':msgs:0') == [b'2']
+
+
+def test_dangling_index_reference():
+    configure(default_flow_cap={'max_len': 1}, indexed_attrs=['user'])
+    tagged_logger.log('foo', user=1)
+    tagged_logger.log('bar', user=1)
+    assert [str(r) for r in tagged_logger.get(where={'user': 1})] == [
+        'bar (user=1)']
+
+
+def test_trim_script_reload():
+    logger = configure(flow_caps={'foo': {'max_len': 2}})
+    logger.redis.script_flush()
+    for i in range(3):
+        tagged_logger.log('foo {0}'.format(i), tags=['foo'])
+    assert [str(r) for r in tagged_logger.get('foo')] == ['foo 2', 'foo 1']
+    # capped writes don't check the script with SCRIPT EXISTS
+    stats = logger.redis.info('commandstats')
+    calls = stats.get('cmdstat_script', {}).get('calls', 0)
+    for i in range(10):
+        tagged_logger.log('foo {0}'.format(i), tags=['foo'])
+    stats = logger.redis.info('commandstats')
+    assert stats.get('cmdstat_script', {}).get('calls', 0) == calls
+    assert len(tagged_logger.get('foo')) == 2
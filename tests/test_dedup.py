@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import time
+import datetime
+import pytz
+import tagged_logger
+from .tools import setup_function, teardown_function, configure, prefix
+
+
+def test_dedup():
+    configure(dedup_window=60)
+    ts = datetime.datetime(2012, 1, 1, tzinfo=pytz.utc)
+    for i in range(3):
+        tagged_logger.log('retrying {url}', url='/foo', tags=['foo'],
+                          ts=ts + datetime.timedelta(seconds=i))
+    tagged_logger.log('retrying {url}', url='/bar', tags=['foo'])
+    records = tagged_logger.get('foo')
+    assert [str(r) for r in records] == ['retrying /bar', 'retrying /foo']
+    record = records[1]
+    assert record.count == 3
+    assert record.first_ts == ts
+    assert record.last_ts == ts + datetime.timedelta(seconds=2)
+    assert records[0].count == 1
+
+
+def test_dedup_disabled():
+    tagged_logger.log('foo')
+    tagged_logger.log('foo')
+    records = tagged_logger.get()
+    assert len(records) == 2
+    assert records[0].count == 1
+    assert records[0].last_ts == records[0].ts
+
+
+def test_dedup_window():
+    configure(dedup_window=0.1)
+    tagged_logger.log('foo')
+    tagged_logger.log('foo')
+    time.sleep(0.15)
+    tagged_logger.log('foo')
+    assert [r.count for r in tagged_logger.get()] == [1, 2]
+
+
+def test_dedup_tags():
+    configure(dedup_window=60)
+    tagged_logger.log('foo', tags=['foo'])
+    tagged_logger.log('foo', tags=['bar'])
+    assert len(tagged_logger.get()) == 2
+
+
+def test_dedup_hash_storage_and_cache():
+    configure(dedup_window=60, storage='hash', cache_size=10)
+    tagged_logger.log('foo', tags=[])
+    assert tagged_logger.get_latest().count == 1
+    tagged_logger.log('foo', tags=[])
+    record = tagged_logger.get_latest()
+    assert record.count == 2
+    assert record.tags == []
+    assert record.attrs == {}
+
+
+def test_dedup_keeps_ttl():
+    logger = configure(dedup_window=60, expire_mode='ttl')
+    tagged_logger.log('foo', expire=3600)
+    tagged_logger.log('foo', expire=3600)
+    assert tagged_logger.get_latest().count == 2
+    assert logger.redis.ttl(prefix + ':msg:1') > 0
+
+
+def test_dedup_first_writer_wins():
+    logger = configure(dedup_window=60)
+    tagged_logger.log('foo')
+    key = logger.redis.keys(prefix + ':dedup:*')[0]
+    # another writer has checked the window before the first one started it
+    dedup, logger._dedup = logger._dedup, lambda **kwargs: None
+    try:
+        tagged_logger.log('foo')
+    finally:
+        logger._dedup = dedup
+    assert logger.redis.get(key) == b'1'
+    tagged_logger.log('foo')
+    assert [r.count for r in tagged_logger.get()] == [1, 2]
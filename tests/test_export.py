@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import io
+import datetime
+import pytz
+import tagged_logger
+from tagged_logger import ta
+from .tools import setup_function, teardown_function
+
+
+def _export(**kwargs):
+    fileobj = io.BytesIO()
+    count = tagged_logger.export(fileobj, **kwargs)
+    fileobj.seek(0)
+    return count, fileobj
+
+
+def test_export_import():
+    tagged_logger.log('foo', ta(user='foo'), tags=['spam'])
+    tagged_logger.log('bar', expire=datetime.datetime(2012, 1, 1))
+    count, fileobj = _export(chunk_size=1)
+    assert count == 2
+    tagged_logger.full_cleanup()
+
+    assert tagged_logger.import_(fileobj) == 2
+    records = tagged_logger.get()
+    assert [str(r) for r in records] == ['bar', 'foo (user=foo)']
+    assert [r.id for r in records] == [2, 1]
+    assert str(tagged_logger.get_latest(user='foo')) == 'foo (user=foo)'
+    assert str(tagged_logger.get_latest('spam')) == 'foo (user=foo)'
+    assert tagged_logger.expire() == 1
+
+
+def test_import_keeps_counter():
+    tagged_logger.log('foo')
+    count, fileobj = _export()
+    tagged_logger.full_cleanup()
+    tagged_logger.import_(fileobj)
+    tagged_logger.log('bar')
+    assert [r.id for r in tagged_logger.get()] == [2, 1]
+
+
+def test_export_time_range():
+    ts = datetime.datetime(2012, 1, 1, tzinfo=pytz.utc)
+    tagged_logger.log('1st January', ts=ts)
+    tagged_logger.log('2nd January', ts=ts + datetime.timedelta(1))
+    tagged_logger.log('3rd January', ts=ts + datetime.timedelta(2))
+    count, fileobj = _export(min_ts=ts + datetime.timedelta(1),
+                             max_ts=ts + datetime.timedelta(1))
+    assert count == 1
+    tagged_logger.full_cleanup()
+    tagged_logger.import_(fileobj)
+    assert [str(r) for r in tagged_logger.get()] == ['2nd January']
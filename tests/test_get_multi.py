@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import datetime
+import tagged_logger
+from .tools import redis_kwargs, prefix
+
+prefixes = [prefix + '_a', prefix + '_b', prefix + '_c']
+
+
+def setup_function(func):
+    for p in prefixes:
+        tagged_logger.configure(p, **redis_kwargs)
+        tagged_logger.full_cleanup()
+    tagged_logger.reset_context()
+
+
+def teardown_function(func):
+    for p in prefixes:
+        tagged_logger.configure(p, **redis_kwargs)
+        tagged_logger.full_cleanup()
+
+
+def _log(p, message, minute, **kwargs):
+    tagged_logger.configure(p, **redis_kwargs)
+    ts = datetime.datetime(2012, 1, 1, 0, minute)
+    tagged_logger.log(message, ts=ts, **kwargs)
+
+
+def test_get_multi():
+    _log(prefixes[0], 'a1', 1)
+    _log(prefixes[1], 'b2', 2)
+    _log(prefixes[0], 'a3', 3)
+    _log(prefixes[2], 'c4', 4)
+    _log(prefixes[1], 'b5', 5)
+    result = list(tagged_logger.get_multi(prefixes))
+    assert [str(r) for p, r in result] == ['b5', 'c4', 'a3', 'b2', 'a1']
+    assert [p for p, r in result] == [prefixes[1], prefixes[2], prefixes[0],
+                                      prefixes[1], prefixes[0]]
+
+
+def test_get_multi_limit_and_chunks():
+    for minute in range(10):
+        _log(prefixes[minute % 2], 'msg {0}'.format(minute), minute)
+    result = tagged_logger.get_multi(prefixes, limit=5, chunk_size=2)
+    assert [str(r) for p, r in result] == ['msg 9', 'msg 8', 'msg 7',
+                                           'msg 6', 'msg 5']
+
+
+def test_get_multi_filters():
+    _log(prefixes[0], 'a1', 1, tags=['foo'])
+    _log(prefixes[1], 'b2', 2, tags=['foo'])
+    _log(prefixes[1], 'b3', 3)
+    _log(prefixes[2], 'c4', 4, tags=['foo'])
+    result = tagged_logger.get_multi(
+        prefixes, 'foo', max_ts=datetime.datetime(2012, 1, 1, 0, 3))
+    assert [str(r) for p, r in result] == ['b2', 'a1']
+
+
+def test_get_multi_is_lazy():
+    _log(prefixes[0], 'a1', 1)
+    result = tagged_logger.get_multi(prefixes)
+    # nothing is queried until the result is consumed
+    _log(prefixes[1], 'b2', 2)
+    assert [str(r) for p, r in result] == ['b2', 'a1']
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import time
+import datetime
+import pytz
+import tagged_logger
+from .tools import setup_function, teardown_function
+
+
+def test_get_since():
+    tagged_logger.log('foo')
+    tagged_logger.log('bar')
+    records, cursor = tagged_logger.get_since()
+    assert [str(r) for r in records] == ['foo', 'bar']
+    assert cursor == records[-1].cursor
+
+    records, cursor2 = tagged_logger.get_since(cursor=cursor)
+    assert records == []
+    assert cursor2 == cursor
+
+    tagged_logger.log('baz')
+    records, cursor = tagged_logger.get_since(cursor=cursor)
+    assert [str(r) for r in records] == ['baz']
+
+
+def test_get_since_tag():
+    tagged_logger.log('foo', tags=['foo'])
+    tagged_logger.log('bar')
+    records, cursor = tagged_logger.get_since('foo')
+    assert [str(r) for r in records] == ['foo']
+
+
+def test_get_since_same_timestamp():
+    """
+    Records sharing the same timestamp are not skipped by a cursor, even if
+    the limit cuts their group in two
+    """
+    ts = datetime.datetime(2012, 1, 1, tzinfo=pytz.utc)
+    for i in range(12):
+        tagged_logger.log('message {0}'.format(i), ts=ts)
+    messages = []
+    cursor = None
+    while True:
+        records, cursor = tagged_logger.get_since(cursor=cursor, limit=5)
+        if not records:
+            break
+        messages += [str(r) for r in records]
+    assert messages == ['message {0}'.format(i) for i in range(12)]
+
+
+def test_follow_poll():
+    tagged_logger.log('foo')
+    tagged_logger.log('bar')
+    tagged_logger.log('baz')
+    records = tagged_logger.follow(backlog=2, poll_interval=0.01)
+    assert str(next(records)) == 'bar'
+    assert str(next(records)) == 'baz'
+    tagged_logger.log('spam')
+    assert str(next(records)) == 'spam'
+    records.close()
+
+
+def test_follow_pubsub():
+    tagged_logger.log('foo', tags=['foo'])
+    tagged_logger.log('bar')
+    records = tagged_logger.follow('foo')
+    assert str(next(records)) == 'foo'
+    tagged_logger.log('spam')
+    tagged_logger.log('egg', tags=['foo'])
+    assert str(next(records)) == 'egg'
+    records.close()
+
+
+def test_follow_poll_same_timestamp():
+    """
+    The backlog holds the latest records in the time order, and polling
+    starts right after it, even if records share the same timestamp
+    """
+    ts = datetime.datetime(2012, 1, 1, tzinfo=pytz.utc)
+    for i in range(11):
+        tagged_logger.log('message {0}'.format(i + 1), ts=ts)
+    records = tagged_logger.follow(backlog=9, poll_interval=0.01)
+    assert [next(records).id for i in range(9)] == list(range(3, 12))
+    tagged_logger.log('spam')
+    assert str(next(records)) == 'spam'
+    records.close()
+
+
+def test_follow_poll_late_record():
+    """
+    Polling picks up records which reach Redis after newer ones, within the
+    overlap window
+    """
+    tagged_logger.log('foo')
+    records = tagged_logger.follow(backlog=1, poll_interval=0.01)
+    assert str(next(records)) == 'foo'
+    tagged_logger.log('bar')
+    assert str(next(records)) == 'bar'
+    late = datetime.datetime.fromtimestamp(time.time() - 1, pytz.utc)
+    tagged_logger.log('late', ts=late)
+    assert str(next(records)) == 'late'
+    tagged_logger.log('baz')
+    assert str(next(records)) == 'baz'
+    records.close()
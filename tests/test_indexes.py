@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import pytest
+import datetime
+import pytz
+import tagged_logger
+from .tools import setup_function, teardown_function, configure
+
+
+def test_where():
+    configure(indexed_attrs=['user_id', 'latency'])
+    tagged_logger.log('foo', user_id=1)
+    tagged_logger.log('bar', user_id=2)
+    tagged_logger.log('baz', user_id=1, tags=['baz'])
+    records = tagged_logger.get(where={'user_id': 1})
+    assert [str(r) for r in records] == ['baz (user_id=1)', 'foo (user_id=1)']
+    records = tagged_logger.get('baz', where={'user_id': 1})
+    assert [str(r) for r in records] == ['baz (user_id=1)']
+    assert tagged_logger.get(where={'user_id': 3}) == []
+
+
+def test_where_range():
+    configure(indexed_attrs=['user_id', 'latency'])
+    for user_id, latency in [(1, 10), (1, 200), (2, 300), (1, 50.5)]:
+        tagged_logger.log('request', user_id=user_id, latency=latency)
+    records = tagged_logger.get(where={'latency': (50, None)})
+    assert [r.attrs['latency'] for r in records] == [50.5, 300, 200]
+    records = tagged_logger.get(where={'latency': (None, 100), 'user_id': 1})
+    assert [r.attrs['latency'] for r in records] == [50.5, 10]
+    records = tagged_logger.get(where={'latency': (0, 1000)}, limit=1)
+    assert [r.attrs['latency'] for r in records] == [50.5]
+
+
+def test_where_ts():
+    configure(indexed_attrs=['user_id', 'latency'])
+    ts = datetime.datetime(2012, 1, 1, tzinfo=pytz.utc)
+    tagged_logger.log('1st January', ts=ts, user_id=1)
+    tagged_logger.log('2nd January', ts=ts + datetime.timedelta(1), user_id=1)
+    records = tagged_logger.get(where={'user_id': 1},
+                                min_ts=ts + datetime.timedelta(hours=1))
+    assert [r.message for r in records] == ['2nd January']
+
+
+def test_where_not_indexed():
+    configure(indexed_attrs=['user_id', 'latency'])
+    with pytest.raises(RuntimeError):
+        tagged_logger.get(where={'foo': 'bar'})
+
+
+def test_where_expire():
+    configure(indexed_attrs=['user_id', 'latency'])
+    tagged_logger.log('foo', user_id=1, latency=1,
+                      ts=datetime.datetime(2012, 1, 1), expire=1)
+    tagged_logger.expire()
+    assert tagged_logger.get(where={'user_id': 1}) == []
+    assert tagged_logger.get(where={'latency': (None, None)}) == []
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import time
+import tagged_logger
+from tagged_logger import ta
+from .tools import setup_function, teardown_function, configure
+
+
+def test_sampling():
+    configure(sampling={'debug': 0, 'info': 1})
+    for i in range(10):
+        tagged_logger.log('debug', tags=['debug'])
+        tagged_logger.log('info', tags=['info'])
+    assert tagged_logger.get('debug') == []
+    assert len(tagged_logger.get('info')) == 10
+
+
+def test_rate_limit():
+    configure(rate_limits={'foo': (0, 2)})
+    for i in range(5):
+        tagged_logger.log('foo {0}'.format(i), tags=['foo'])
+    tagged_logger.log('bar')
+    assert [str(r) for r in tagged_logger.get()] == ['bar', 'foo 1', 'foo 0']
+
+
+def test_rate_limit_refill():
+    configure(rate_limits={'__all__': (50, 1)})
+    tagged_logger.log('foo')
+    tagged_logger.log('bar')
+    time.sleep(0.05)
+    tagged_logger.log('baz')
+    assert [str(r) for r in tagged_logger.get()] == ['baz', 'foo']
+
+
+def test_rate_limit_tagging_attrs():
+    configure(rate_limits={'ip': (0, 1)})
+    tagged_logger.log('foo', ta(ip='127.0.0.1'))
+    tagged_logger.log('bar', ta(ip='127.0.0.1'))
+    tagged_logger.log('baz', ta(ip='127.0.0.2'))
+    assert len(tagged_logger.get()) == 2
+
+
+def test_suppressed_report():
+    configure(rate_limits={'foo': (0, 1)}, suppressed_report_interval=0.2)
+    for i in range(4):
+        tagged_logger.log('foo', tags=['foo'])
+    time.sleep(0.2)
+    tagged_logger.log('bar')
+    record = tagged_logger.get_latest(tagged_logger.SUPPRESSED_TAG)
+    assert record.attrs['suppressed'] == 3
+    assert record.attrs['suppressed_by_tag'] == {'foo': 3}
+    assert 'foo' in record.tags
+
+
+def test_cluster_rate_limit():
+    configure(rate_limits={'foo': (2, 2)}, rate_limit_scope='cluster')
+    while time.time() % 1 > 0.5:
+        time.sleep(0.05)
+    for i in range(5):
+        tagged_logger.log('foo', tags=['foo'])
+    assert len(tagged_logger.get('foo')) == 2
+
+
+def test_rate_limit_dropped_records_keep_tokens():
+    """
+    Records dropped by the limit of their tag don't spend tokens of other
+    buckets
+    """
+    configure(rate_limits={'__all__': (0, 100), 'debug': (0, 5)})
+    for i in range(200):
+        tagged_logger.log('debug', tags=['debug'])
+    tagged_logger.log('error', tags=['error'])
+    assert len(tagged_logger.get('debug')) == 5
+    assert str(tagged_logger.get_latest()) == 'error'
+
+
+def test_cluster_rate_limit_dropped_records_keep_tokens():
+    configure(rate_limits={'__all__': (100, 100), 'debug': (5, 5)},
+              rate_limit_scope='cluster')
+    while time.time() % 1 > 0.5:
+        time.sleep(0.05)
+    for i in range(200):
+        tagged_logger.log('debug', tags=['debug'])
+    tagged_logger.log('error', tags=['error'])
+    assert str(tagged_logger.get_latest()) == 'error'
+
+
+def test_suppressed_report_by_setting():
+    configure(rate_limits={'ip': (0, 1)}, suppressed_report_interval=0.2)
+    for i in range(10):
+        tagged_logger.log('foo', ta(ip='10.0.0.{0}'.format(i)))
+        tagged_logger.log('foo', ta(ip='10.0.0.{0}'.format(i)))
+    time.sleep(0.2)
+    tagged_logger.log('bar')
+    record = tagged_logger.get_latest(tagged_logger.SUPPRESSED_TAG)
+    assert record.attrs['suppressed_by_tag'] == {'ip': 10}
+    assert sorted(record.tags) == sorted([tagged_logger.SUPPRESSED_TAG, 'ip'])
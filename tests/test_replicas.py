@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import time
+import pytest
+import redis
+import tagged_logger
+from .tools import redis_kwargs, replica_kwargs, prefix, configure
+from .tools import teardown_function  # NOQA
+
+replica = redis.Redis(**replica_kwargs)
+primary = redis.Redis(**redis_kwargs)
+
+
+def setup_function(func):
+    try:
+        replica.ping()
+    except redis.ConnectionError:
+        pytest.skip('Redis replica is not running on {host}:{port}'.format(
+            **replica_kwargs))
+    configure(read_replicas=[replica_kwargs])
+    tagged_logger.full_cleanup()
+    tagged_logger.reset_context()
+
+
+def _calls(client, command):
+    stats = client.info('commandstats').get('cmdstat_' + command, {})
+    return stats.get('calls', 0)
+
+
+def _sync():
+    # wait until the replica catches up
+    for i in range(100):
+        if replica.get(prefix + ':counter') == primary.get(prefix + ':counter'):
+            return
+        time.sleep(0.01)
+
+
+def test_get_from_replica():
+    tagged_logger.log('foo', tags=['foo'])
+    _sync()
+    calls = _calls(replica, 'zrevrangebyscore'), _calls(replica, 'mget')
+    primary_calls = _calls(primary, 'zrevrangebyscore')
+    assert [str(r) for r in tagged_logger.get('foo')] == ['foo']
+    assert _calls(replica, 'zrevrangebyscore') == calls[0] + 1
+    assert _calls(replica, 'mget') == calls[1] + 1
+    assert _calls(primary, 'zrevrangebyscore') == primary_calls
+
+
+def test_read_your_writes():
+    configure(read_replicas=[replica_kwargs], read_your_writes=1)
+    calls = _calls(replica, 'zrevrangebyscore')
+    tagged_logger.log('foo')
+    assert str(tagged_logger.get_latest()) == 'foo'
+    assert _calls(replica, 'zrevrangebyscore') == calls
+
+
+def test_replica_selection():
+    down = dict(host='localhost', port=6399)
+    configure(read_replicas=[down, replica_kwargs],
+              replica_selection='latency')
+    assert tagged_logger.get() == []
+    configure(read_replicas=[down])
+    assert tagged_logger.get() == []
+    pool = tagged_logger.ReplicaPool([primary, replica])
+    assert [pool.client() for i in range(3)] == [replica, primary, replica]
+    with pytest.raises(RuntimeError):
+        configure(read_replicas=[replica_kwargs], replica_selection='random')
+
+
+def test_pubsub_on_replica():
+    tagged_logger.subscribe()
+    tagged_logger.log('foo')
+    for record in tagged_logger.listen():
+        assert str(record) == 'foo'
+        break
+    tagged_logger.unsubscribe()
+
+
+def test_replica_probes():
+    logger = configure(read_replicas=[replica_kwargs])
+    kwargs = logger.replicas.clients[0].connection_pool.connection_kwargs
+    assert kwargs['socket_timeout'] == tagged_logger.REPLICA_TIMEOUT
+    assert kwargs['socket_connect_timeout'] == tagged_logger.REPLICA_TIMEOUT
+    # readers never wait for probes
+    pings = _calls(replica, 'ping')
+    for i in range(5):
+        tagged_logger.get()
+    assert _calls(replica, 'ping') == pings
+
+
+def test_discard_other_prefix():
+    """
+    References found by loggers of other prefixes are checked against
+    records of their own prefix
+    """
+    logger = configure(read_replicas=[replica_kwargs])
+    other = logger._for_prefix(prefix + '_other')
+    try:
+        tagged_logger.log('foo')
+        tagged_logger.log('bar')
+        other.log('baz')
+        key = other._key('flow:__all__')
+        primary.zadd(key, 2, 2)
+        logger.compactor.discard(key, ['1', '2'], other)
+        logger.compactor.join()
+        assert primary.zrange(key, 0, -1) == [b'1']
+    finally:
+        other.full_cleanup()
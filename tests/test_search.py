@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import pytest
+import datetime
+import tagged_logger
+from .tools import setup_function, teardown_function, configure
+
+
+def test_search():
+    configure(text_index=True)
+    tagged_logger.log('Connection to {host} timed out', host='db1')
+    tagged_logger.log('Connection to {host} established', host='db1')
+    tagged_logger.log('Connection to {host} timed out', host='db2',
+                      tags=['foo'])
+    records = tagged_logger.search('timed out')
+    assert [str(r) for r in records] == ['Connection to db2 timed out',
+                                         'Connection to db1 timed out']
+    records = tagged_logger.search('DB1 connection')
+    assert len(records) == 2
+    records = tagged_logger.search('timed', tag='foo')
+    assert [str(r) for r in records] == ['Connection to db2 timed out']
+    assert len(tagged_logger.search('timed', limit=1)) == 1
+    assert tagged_logger.search('db3') == []
+
+
+def test_search_attrs():
+    configure(text_index=True)
+    tagged_logger.log('request failed', url='/index', status=502)
+    records = tagged_logger.search('502 failed')
+    assert len(records) == 1
+
+
+def test_search_stop_words():
+    configure(text_index=True)
+    tagged_logger.log('the quick brown fox')
+    assert tagged_logger.search('the') == []
+    assert len(tagged_logger.search('the fox')) == 1
+
+
+def test_search_max_tokens():
+    configure(text_index=True, max_tokens=2)
+    tagged_logger.log('one two three')
+    assert len(tagged_logger.search('two')) == 1
+    assert tagged_logger.search('three') == []
+
+
+def test_search_expire():
+    configure(text_index=True)
+    tagged_logger.log('timeout', ts=datetime.datetime(2012, 1, 1), expire=1)
+    tagged_logger.expire()
+    assert tagged_logger.search('timeout') == []
+
+
+def test_search_disabled():
+    with pytest.raises(RuntimeError):
+        tagged_logger.search('foo')
+
+
+def test_matches():
+    tagged_logger.log('Connection to {host} timed out', host='db1')
+    record = tagged_logger.get_latest()
+    assert record.matches('timed db1')
+    assert not record.matches('db2')
+
+
+def test_tokenize():
+    assert tagged_logger.tokenize('The Timeout of a db-1 request, timeout!') == [
+        'timeout', 'db', 'request']
+
+
+def test_search_unrenderable_message():
+    configure(text_index=True)
+    tagged_logger.log('req {d[id]}', d={})
+    tagged_logger.log('item {x[0]}', x=5)
+    assert len(tagged_logger.get()) == 2
+    assert len(tagged_logger.search('req')) == 1
+    assert len(tagged_logger.search('item')) == 1
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import threading
+import json
+import shutil
+import datetime
+import tempfile
+import redis
+import tagged_logger
+from tagged_logger.spool import _segment_key
+from .tools import setup_function as _setup, teardown_function as _teardown
+from .tools import redis_kwargs, prefix, configure
+
+spool_dir = None
+down = redis.Redis(host='localhost', port=6399, socket_timeout=0.1)
+
+
+def setup_function(func):
+    global spool_dir
+    _setup(func)
+    spool_dir = tempfile.mkdtemp()
+
+
+def teardown_function(func):
+    _teardown(func)
+    configure()
+    shutil.rmtree(spool_dir)
+
+
+def _spooled():
+    ret = []
+    for name in os.listdir(spool_dir):
+        with open(os.path.join(spool_dir, name)) as fd:
+            ret += [json.loads(line)['message'] for line in fd]
+    return ret
+
+
+def test_spool():
+    logger = configure(spool_dir=spool_dir, spool_retry_interval=3600)
+    tagged_logger.log('foo')
+    assert [str(r) for r in tagged_logger.get()] == ['foo']
+    assert not logger.spool.opened
+
+    client, logger.spool.client = logger.spool.client, down
+    ts = datetime.datetime(2012, 1, 1)
+    tagged_logger.log('bar', tags=['bar'], ts=ts)
+    assert logger.spool.opened
+    # the circuit is open, so that Redis is not even tried
+    logger.spool.client = client
+    tagged_logger.log('baz')
+    assert sorted(_spooled()) == ['bar', 'baz']
+    assert [str(r) for r in tagged_logger.get()] == ['foo']
+
+    assert logger.spool.replay() == 2
+    assert not logger.spool.opened
+    assert os.listdir(spool_dir) == []
+    assert [str(r) for r in tagged_logger.get()] == ['baz', 'foo', 'bar']
+    record = tagged_logger.get_latest('bar')
+    assert record.ts.replace(tzinfo=None) == ts
+    assert len(set(r.id for r in tagged_logger.get())) == 3
+    tagged_logger.log('qux')
+    assert _spooled() == []
+    assert str(tagged_logger.get_latest()) == 'qux'
+
+
+def test_replay_failure():
+    logger = configure(spool_dir=spool_dir, spool_retry_interval=3600)
+    logger.spool.client = down
+    tagged_logger.log('foo')
+    tagged_logger.log('bar')
+    primary, logger.redis = logger.redis, down
+    try:
+        logger.spool.replay()
+    except redis.RedisError:
+        pass
+    logger.redis = primary
+    assert logger.spool.opened
+    assert [name.endswith('.ndjson') for name in os.listdir(spool_dir)] == [True]
+    assert logger.spool.replay() == 2
+    assert len(tagged_logger.get()) == 2
+
+
+def test_recover_segments_of_dead_processes():
+    key = _segment_key(prefix, redis.Redis(**redis_kwargs))
+    segment = os.path.join(spool_dir, '{0:017.6f}-999999-{1}'.format(0, key))
+    with open(segment + '.open', 'w') as fd:
+        fd.write(json.dumps({'ts': 1, 'message': 'foo', 'attrs': {},
+                             'tags': [], 'expire': None}) + '\n')
+    logger = configure(spool_dir=spool_dir, spool_retry_interval=3600)
+    assert logger.spool.pending() == [segment + '.ndjson']
+    assert logger.spool.replay() == 1
+    assert str(tagged_logger.get_latest()) == 'foo'
+
+
+def test_spool_shared_by_prefixes():
+    logger = configure(spool_dir=spool_dir, spool_retry_interval=3600)
+    other = tagged_logger.Logger(prefix + '_other', spool_dir=spool_dir,
+                                 spool_retry_interval=3600, **redis_kwargs)
+    try:
+        logger.spool.client = down
+        tagged_logger.log('foo')
+        logger.spool.stop()
+        assert other.spool.pending() == []
+        assert other.spool.replay() == 0
+        assert logger.spool.replay() == 1
+        assert str(tagged_logger.get_latest()) == 'foo'
+        assert other.get() == []
+    finally:
+        other.spool.stop()
+        other.full_cleanup()
+
+
+def test_spool_budget_of_whole_write():
+    """
+    Redis, which is slow but responds within the timeout to every command,
+    doesn't hold the write for longer than the budget and one round trip
+    """
+    logger = configure(spool_dir=spool_dir, spool_retry_interval=3600,
+                       spool_timeout=0.05, rate_limit_scope='cluster',
+                       rate_limits={'__all__': (1000, 1000)},
+                       dedup_window=60)
+    client = logger.spool.client
+    execute_command = client.execute_command
+
+    def slow_execute_command(*args, **kwargs):
+        time.sleep(0.03)
+        return execute_command(*args, **kwargs)
+
+    client.execute_command = slow_execute_command
+    start = time.time()
+    tagged_logger.log('foo')
+    assert time.time() - start < 0.09
+    assert logger.spool.opened
+    assert _spooled() == ['foo']
+
+
+def test_spool_bounds_latency():
+    logger = configure(spool_dir=spool_dir, spool_retry_interval=3600,
+                       spool_timeout=0.05, rate_limit_scope='cluster',
+                       rate_limits={'__all__': (1000, 1000)},
+                       dedup_window=60, cache_size=10,
+                       cache_invalidation=True)
+    tagged_logger.log('foo')
+    stall = threading.Thread(target=redis.Redis(**redis_kwargs).execute_command,
+                             args=('DEBUG', 'SLEEP', 0.5))
+    stall.start()
+    time.sleep(0.1)
+    try:
+        for message in ('foo', 'bar'):
+            start = time.time()
+            tagged_logger.log(message)
+            assert time.time() - start < 0.3
+        assert logger.spool.opened
+    finally:
+        stall.join()
+    logger.spool.replay()
+    assert sorted(str(r) for r in tagged_logger.get()) == ['bar', 'foo', 'foo']
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import io
+import datetime
+import pytest
+import tagged_logger
+from .tools import setup_function, teardown_function, configure, prefix
+
+
+def test_hash_storage():
+    logger = configure(storage='hash', hash_bucket_size=2)
+    for i in range(5):
+        tagged_logger.log('message {0}'.format(i))
+    records = tagged_logger.get()
+    assert [str(r) for r in records] == ['message {0}'.format(i)
+                                         for i in reversed(range(5))]
+    assert logger.redis.keys(prefix + ':msg:*') == []
+    assert len(logger.redis.keys(prefix + ':msgs:*')) == 3
+    assert logger.redis.hget(prefix + ':msgs:2', '5') is not None
+
+
+def test_hash_storage_expire():
+    logger = configure(storage='hash', hash_bucket_size=2)
+    tagged_logger.log('foo', ts=datetime.datetime(2012, 1, 1), expire=1)
+    tagged_logger.log('bar')
+    assert tagged_logger.expire() == 1
+    assert [str(r) for r in tagged_logger.get()] == ['bar']
+    assert logger.redis.hkeys(prefix + ':msgs:0') == []
+
+
+def test_hash_storage_export():
+    configure(storage='hash', hash_bucket_size=2, cache_size=10)
+    tagged_logger.log('foo')
+    tagged_logger.log('bar')
+    fileobj = io.BytesIO()
+    tagged_logger.export(fileobj)
+    fileobj.seek(0)
+    tagged_logger.full_cleanup()
+    tagged_logger.import_(fileobj)
+    assert [str(r) for r in tagged_logger.get()] == ['bar', 'foo']
+
+
+def test_unknown_storage():
+    with pytest.raises(RuntimeError):
+        configure(storage='foo')
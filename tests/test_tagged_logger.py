@@ -227,3 +227,16 @@ def test_extra_arguments():
     tagged_logger.log('{user}', user='foo', user_email='foo@example.com')
     record = tagged_logger.get_latest()
     assert str(record) == 'foo (user_email=foo@example.com)'
+
+
+def test_aware_timestamps():
+    """
+    Aware datetimes are converted with their UTC offset
+    """
+    moscow = pytz.timezone('Europe/Moscow')
+    ts = moscow.localize(datetime.datetime(2016, 1, 1, 3))
+    tagged_logger.log('new year in UTC', ts=ts)
+    record = tagged_logger.get_latest()
+    assert record.ts == datetime.datetime(2016, 1, 1, tzinfo=pytz.utc)
+    assert record.record['ts'] == 1451606400
+    assert tagged_logger.get(max_ts=ts - datetime.timedelta(seconds=1)) == []
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import time
+import datetime
+import pytest
+import tagged_logger
+from .tools import setup_function, teardown_function, configure, prefix
+
+
+def test_ttl():
+    logger = configure(expire_mode='ttl')
+    tagged_logger.log('foo', expire=3600)
+    assert 0 < logger.redis.ttl(prefix + ':msg:1') <= 3600
+    assert not logger.redis.exists(prefix + ':flow:__expire__')
+    assert tagged_logger.expire() == 0
+    assert str(tagged_logger.get_latest()) == 'foo'
+
+
+def test_ttl_expired():
+    logger = configure(expire_mode='ttl', cache_size=10)
+    tagged_logger.log('foo', expire=0.2, tags=['foo'])
+    tagged_logger.log('bar', tags=['foo'])
+    assert len(tagged_logger.get('foo')) == 2
+    time.sleep(0.3)
+    assert [str(r) for r in tagged_logger.get('foo')] == ['bar']
+    logger.compactor.join()
+    assert logger.redis.zcard(prefix + ':flow:foo') == 1
+    assert logger.redis.zcard(prefix + ':flow:__all__') == 2
+
+
+def test_missing_record():
+    logger = configure()
+    tagged_logger.log('foo')
+    tagged_logger.log('bar')
+    logger.redis.delete(prefix + ':msg:1')
+    assert [str(r) for r in tagged_logger.get()] == ['bar']
+    logger.compactor.join()
+    assert logger.redis.zcard(prefix + ':flow:__all__') == 1
+
+
+def test_compact():
+    logger = configure(expire_mode='ttl', indexed_attrs=['user'])
+    tagged_logger.log('foo', user=1, tags=['foo'])
+    tagged_logger.log('bar', user=1)
+    logger.redis.delete(prefix + ':msg:1')
+    removed = sum(tagged_logger.compact() for i in range(10))
+    # flow:__all__, flow:foo, idx:user:1 and idxnum:user
+    assert removed == 4
+    assert logger.redis.zcard(prefix + ':flow:__all__') == 1
+    assert not logger.redis.exists(prefix + ':flow:foo')
+    assert logger.redis.zcard(prefix + ':idx:user:1') == 1
+    assert logger.redis.zcard(prefix + ':idxnum:user') == 1
+
+
+def test_relative_expire():
+    tagged_logger.log('foo', expire=datetime.timedelta(hours=1))
+    record = tagged_logger.get_latest()
+    delta = (record.expire - record.ts).total_seconds()
+    assert abs(delta - 3600) < 1
+
+
+def test_ttl_requires_string_storage():
+    with pytest.raises(RuntimeError):
+        configure(expire_mode='ttl', storage='hash')
@@ -12,3 +12,17 @@ def setup_function(func):
 
 def teardown_function(func):
     tagged_logger.full_cleanup()
+
+
+# replica of the server above, used by tests/test_replicas.py
+replica_kwargs = dict(host='localhost', port=6380, db=0)
+
+
+def configure(**kwargs):
+    """
+    Configure the global logger for tests, with given options on top of the
+    test connection settings
+    """
+    options = dict(redis_kwargs)
+    options.update(kwargs)
+    return tagged_logger.configure(prefix=prefix, **options)